@@ -0,0 +1,73 @@
+import numpy as np
+from datetime import date
+
+
+# payment cycles stepped in whole months, and in whole days
+monthcycles = {12: 1, 4: 3, 2: 6, 1: 12}
+daycycles = {365.25: 1, 365: 1, 52: 7, 26: 14}
+
+# calendars already calculated, keyed on (start_date, cyclesPerAnnum), least recently used first
+_calendars = {}
+_maxcalendars = 256
+
+
+# ============================================================================
+def _stepdates(start_date, numperiods, cyclesPerAnnum):
+    """Returns the dates obtained by repeatedly adding one relativedelta step to start_date
+
+    Month steps accumulate the day-of-month clipping, i.e. once the 31st was clipped
+    to the 28th of February all later dates fall on the 28th, as with relativedelta.
+    """
+    if cyclesPerAnnum in monthcycles:
+        step = monthcycles[cyclesPerAnnum]
+        months = np.datetime64(f'{start_date.year:04d}-{start_date.month:02d}', 'M') + step * np.arange(numperiods)
+        firstday = months.astype('datetime64[D]')
+        monthdays = ((months + 1).astype('datetime64[D]') - firstday).astype(np.int64)
+        days = np.minimum.accumulate(np.minimum(monthdays, start_date.day))
+        return firstday + (days - 1)
+    if cyclesPerAnnum in daycycles:
+        return np.datetime64(start_date, 'D') + daycycles[cyclesPerAnnum] * np.arange(numperiods)
+    raise ValueError(f'Unknown cyclesPerAnnum = {cyclesPerAnnum}, use one of '
+                     f'{sorted(list(monthcycles) + list(daycycles))}')
+
+
+# ============================================================================
+def periodcalendar(start_date, cyclesPerAnnum, numperiods):
+    """Returns the period dates and year boundaries for numperiods payment cycles
+
+    The calendar is calculated once per (start_date, cyclesPerAnnum) for a horizon of at
+    least numperiods and shared by all later calls, which receive read-only views.
+
+    Supported cycles are 12 (monthly), 4 (quarterly), 2 (half-yearly) and 1 (annually),
+    stepped in months as with relativedelta(months=...), and 365.25 or 365 (daily),
+    52 (weekly) and 26 (fortnightly), stepped in days.
+
+    :param start_date: Date of the first period.
+    :param cyclesPerAnnum: Number of payment cycles in a year.
+    :param numperiods: Number of periods required.
+
+    :return:
+        dates: period dates as numpy datetime64[D] array
+        yearidx: number of calendar year boundaries crossed since the first period
+        newyear: True for the periods that start a new calendar year (never the first period)
+    """
+    key = (date(start_date.year, start_date.month, start_date.day), cyclesPerAnnum)
+    numperiods = max(int(numperiods), 0)
+    calendar = _calendars.pop(key, None)
+    if calendar is None or calendar[0].shape[0] < numperiods:
+        capacity = 512
+        while capacity < numperiods:
+            capacity *= 2
+        dates = _stepdates(key[0], capacity, cyclesPerAnnum)
+        years = dates.astype('datetime64[Y]').astype(np.int64)
+        yearidx = years - years[0]
+        newyear = np.diff(yearidx, prepend=0) != 0
+        for arr in (dates, yearidx, newyear):
+            arr.flags.writeable = False
+        calendar = (dates, yearidx, newyear)
+    _calendars[key] = calendar
+    if len(_calendars) > _maxcalendars:
+        del _calendars[next(iter(_calendars))]
+
+    dates, yearidx, newyear = calendar
+    return dates[:numperiods], yearidx[:numperiods], newyear[:numperiods]
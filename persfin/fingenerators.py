@@ -9,7 +9,8 @@ import matplotlib.pyplot as plt
 
 sys.path = ["./"]+sys.path
 
-import utilityfuns as ufun
+import calendarfuns as cal
+import jitfuns as jit
 
 
 # ============================================================================
@@ -24,7 +25,7 @@ def amortise(principal, interest_rate, bondyears, reqpayment, addpayment,start_d
     :param reqpayment: Payment amount per period
     :param addpayment: Initial value of additional payments to be made each period.
     :param start_date: Start date for the loan.
-    :param cyclesPerAnnum: Number of payment cycles in a year.
+    :param cyclesPerAnnum: Number of payment cycles in a year, see calendarfuns.periodcalendar.
     :param addpayrate: Rate of increase in additional payment, calculated once per year.
     :param ID: String ID for this calculation.
 
@@ -36,10 +37,17 @@ def amortise(principal, interest_rate, bondyears, reqpayment, addpayment,start_d
     p = 1
     beg_balance = principal
     end_balance = principal
-    currentyear = start_date.year
+    dates, _, newyear = cal.periodcalendar(start_date, cyclesPerAnnum, bondyears * cyclesPerAnnum + 2)
 
     while end_balance > 0:
         
+        if p > dates.shape[0]:
+            dates, _, newyear = cal.periodcalendar(start_date, cyclesPerAnnum, 2 * p)
+
+        # only increase the additional payment once per year
+        if newyear[p-1]:
+            addpayment *= 1 + addpayrate
+
         # Recalculate the interest based on the current balance
         interest = - round(((interest_rate/cyclesPerAnnum) * beg_balance), 2)
         
@@ -51,7 +59,7 @@ def amortise(principal, interest_rate, bondyears, reqpayment, addpayment,start_d
         
         end_balance = beg_balance - interest  + reqpayment  + addpayment
 
-        yield OrderedDict([('Month',start_date),
+        yield OrderedDict([('Month',dates[p-1].item()),
                            ('Period', p),
                            ('Begin Balance', beg_balance),
                            ('ReqPayment', reqpayment),
@@ -63,29 +71,410 @@ def amortise(principal, interest_rate, bondyears, reqpayment, addpayment,start_d
                            ('ID', ID),
                           ])
         
-        # Increment the counter, balance and date
+        # Increment the counter and balance
         p += 1
-        
-        if cyclesPerAnnum == 12:
-            start_date += relativedelta(months=1)
-        elif  cyclesPerAnnum == 365.25:
-            start_date += relativedelta(days=1)
-        else:
-            print(f'Unknown cyclesPerAnnum = {cyclesPerAnnum}')
-            return None
+        beg_balance = end_balance
+
 
+
+# ============================================================================
+def _amortise_periods(principal, ratec, reqpayment, addyear, doschedule=True):
+    """Amortises a single loan in plain python, as jitfuns.amortise_schedule without numba
+
+    The values are collected in lists and converted to an array once. The interest is 
+    rounded as round(x, 2), but by rounding x * 100 to an integer, which is much faster; 
+    only when x * 100 falls on a half cent is round(x, 2) needed to round the exact x.
+
+    :param principal: Amount borrowed (positive)
+    :param ratec: Interest rate per period
+    :param reqpayment: Required payment (negative)
+    :param addyear: Additional payment (negative) in each period, list of floats
+    :param doschedule: If False, no per-period values are stored.
+
+    :return:
+        numperiods: number of payments, -1 if the loan is not paid off within addyear
+        totinterest: total interest, summed period by period
+        cols: (5 x numperiods) array of Begin Balance, ReqPayment, AddPayment, Interest 
+            and End Balance, or None if doschedule is False
+    """
+    begbal = []
+    interests = []
+    beg_balance = principal
+    totinterest = 0.
+    payreq = -reqpayment
+    for p, add in enumerate(addyear):
+        # the (positive) interest, the owed amount is the same as beg_balance - (- interest)
+        product = ratec * beg_balance
+        cents = product * 100.
+        rounded = round(cents)
+        half = cents - rounded
+        interest = rounded / 100. if half != 0.5 and half != -0.5 else round(product, 2)
+        owed = beg_balance + interest
+        end_balance = owed + reqpayment + add
+        totinterest -= interest
+        if end_balance <= 0 or owed < payreq or owed + reqpayment < -add:
+            numperiods = p + 1
+            if not doschedule:
+                return numperiods, totinterest, None
+            # final period, with the payments reduced to what is left to pay off
+            req = - min(payreq, owed)
+            add = - min(-add, owed + req)
+            begbal.append(beg_balance)
+            interests.append(-interest)
+            cols = np.array([begbal, [reqpayment] * numperiods, addyear[:numperiods], interests,
+                             begbal[1:] + [owed + req + add]])
+            cols[1, -1] = req
+            cols[2, -1] = add
+            return numperiods, totinterest, cols
+        if doschedule:
+            begbal.append(beg_balance)
+            interests.append(-interest)
         beg_balance = end_balance
-        
-        # only increase the additional payment once per year
-        if start_date.year != currentyear:
-            currentyear = start_date.year
-            addpayment *= 1 + addpayrate
+    return -1, totinterest, None
+
+
+# ============================================================================
+def _escalatedpayments(addpayment, addpayrate, yearidx):
+    """Returns the additional payment of each period, escalated once per year
+
+    The escalation is multiplied out year after year, in the same order as the generator.
+    """
+    addvals = np.empty(yearidx[-1] + 1)
+    addvals[0] = addpayment
+    addvals[1:] = 1 + addpayrate
+    return np.multiply.accumulate(addvals)[yearidx]
+
+
+# ============================================================================
+def amortise_arrays(principal, interest_rate, bondyears, reqpayment, addpayment, start_date, 
+                    cyclesPerAnnum, addpayrate=0, maxyears=200):
+    """
+    Calculate the amortization schedule columns into preallocated numpy arrays.
+
+    This gives the same numbers as the amortise generator, but stores each column
+    in its own array rather than yielding one dictionary per period. The periods are 
+    calculated by the compiled jitfuns.amortise_schedule if numba is available, else by
+    _amortise_periods in plain python. The 10x speed-up of amortisation_table over the 
+    generator needs numba; in plain python it is about 8-12x for a 20-year loan.
+
+    :param principal: Amount borrowed
+    :param interest_rate: The annual interest rate for this loan
+    :param bondyears: Number of years for the loan
+    :param reqpayment: Payment amount per period
+    :param addpayment: Initial value of additional payments to be made each period.
+    :param start_date: Start date for the loan.
+    :param cyclesPerAnnum: Number of payment cycles in a year, see calendarfuns.periodcalendar.
+    :param addpayrate: Rate of increase in additional payment, calculated once per year.
+    :param maxyears: Give up if the loan is not paid off within this many years.
+
+    :return: 
+        schedule: Amortization schedule as an Ordered Dictionary of numpy arrays
+    """
+
+    ratec = float(interest_rate / cyclesPerAnnum)
+    reqpayment = float(reqpayment)
+    capacity = max(int(np.ceil(bondyears * cyclesPerAnnum)) + 2, 1)
+
+    while True:
+        dates, yearidx, _ = cal.periodcalendar(start_date, cyclesPerAnnum, capacity)
+
+        addyear = _escalatedpayments(addpayment, addpayrate, yearidx)
+
+        # the recurrence is sequential, so run it as a compiled loop into the columns
+        if jit.havejit:
+            cols = np.empty((5, capacity))
+            numperiods, _ = jit.amortise_schedule(float(principal), ratec, reqpayment, addyear, cols, True)
+        else:
+            numperiods, _, cols = _amortise_periods(float(principal), ratec, reqpayment, addyear.tolist())
+        if numperiods >= 0:
+            break
+        if capacity >= maxyears * cyclesPerAnnum:
+            raise ValueError(f'Loan is not paid off within {maxyears} years')
+        capacity *= 2
+
+    columns = OrderedDict([('Period', np.arange(1, numperiods + 1)),
+                           ('Month', dates[:numperiods])])
+    for key, col in zip(['Begin Balance', 'ReqPayment', 'AddPayment', 'Interest', 'End Balance'], cols):
+        columns[key] = col[:numperiods]
+    return columns
+
+
+# empty columns for jitfuns.amortise_schedule when nothing is stored
+_nocolumns = np.empty((5, 0))
+
+
+# ============================================================================
+def amortise_summary(principal, interest_rate, bondyears, reqpayment, addpayment, start_date, 
+                     cyclesPerAnnum, addpayrate=0, closedform=False, maxyears=200):
+    """
+    Calculate the payoff information of a loan without building the schedule.
+
+    By default the same recurrence as amortise_arrays is run without storing any of the 
+    periods, so that the number of payments and the payoff date are those of the schedule. 
+    The total interest is summed period by period, which can differ by about 1e-9 from 
+    the sum of the schedule's Interest column. With closedform, and when 
+    the additional payment does not escalate, the number of payments follows from the 
+    annuity formula and the total interest from the payments made. The closed form does 
+    not round the interest to cents every period, so that the total interest can drift by 
+    a few Rand from the schedule over a long loan, and the payoff can move by one period 
+    when the final payment is very small.
+
+    :param principal: Amount borrowed
+    :param interest_rate: The annual interest rate for this loan
+    :param bondyears: Number of years for the loan
+    :param reqpayment: Payment amount per period
+    :param addpayment: Initial value of additional payments to be made each period.
+    :param start_date: Start date for the loan.
+    :param cyclesPerAnnum: Number of payment cycles in a year, see calendarfuns.periodcalendar.
+    :param addpayrate: Rate of increase in additional payment, calculated once per year.
+    :param closedform: Use the annuity closed form where possible. Default False.
+    :param maxyears: Give up if the loan is not paid off within this many years.
+
+    :return: 
+        payoff_date: date of the final payment, as numpy datetime64
+        numpayments: number of payments
+        totinterest: total interest (negative)
+    """
+
+    ratec = interest_rate / cyclesPerAnnum
+    reqpayment = float(reqpayment)
+    beg_balance = float(principal)
+    if beg_balance <= 0:
+        return np.datetime64(start_date, 'D'), 0, 0.
+
+    if closedform and (addpayrate == 0 or addpayment == 0):
+        payment = - (reqpayment + addpayment)
+        if ratec * beg_balance >= payment:
+            raise ValueError('Loan is never paid off, the payment does not cover the interest')
+        if ratec == 0:
+            numpayments = int(np.ceil(beg_balance / payment))
+        else:
+            numpayments = int(np.ceil(- np.log1p(- ratec * beg_balance / payment) / np.log1p(ratec)))
+        numpayments = max(numpayments, 1)
+        # balance before the final payment, then all payments less the principal
+        growth = (1 + ratec) ** (numpayments - 1)
+        final = beg_balance * growth
+        if ratec != 0:
+            final -= payment * (growth - 1) / ratec
+        else:
+            final -= payment * (numpayments - 1)
+        totinterest = - ((numpayments - 1) * payment + final * (1 + ratec) - beg_balance)
+        dates, _, _ = cal.periodcalendar(start_date, cyclesPerAnnum, numpayments)
+        return dates[-1], numpayments, totinterest
+
+    capacity = max(int(np.ceil(bondyears * cyclesPerAnnum)) + 2, 1)
+    ratec = float(ratec)
+
+    while True:
+        dates, yearidx, _ = cal.periodcalendar(start_date, cyclesPerAnnum, capacity)
+        addyear = _escalatedpayments(addpayment, addpayrate, yearidx)
+        if jit.havejit:
+            numperiods, totinterest = jit.amortise_schedule(beg_balance, ratec, reqpayment, addyear, 
+                                                            _nocolumns, False)
+        else:
+            numperiods, totinterest, _ = _amortise_periods(beg_balance, ratec, reqpayment, addyear.tolist(),
+                                                           doschedule=False)
+        if numperiods >= 0:
+            return dates[numperiods - 1], numperiods, totinterest
+
+        if capacity >= maxyears * cyclesPerAnnum:
+            raise ValueError(f'Loan is not paid off within {maxyears} years')
+        capacity *= 2
+
+
+# ============================================================================
+def _changepoints(changes):
+    """Returns the dates and rates of a list of (date, rate) change points, sorted on date and rate
+    """
+    changedates = pd.to_datetime([d for d, _ in changes]).values.astype('datetime64[D]')
+    changerates = np.array([r for _, r in changes], dtype=float)
+    order = np.lexsort((changerates, changedates))
+    return changedates[order], changerates[order]
+
+
+# ============================================================================
+def ratepath(interest_rate, start_date, cyclesPerAnnum, numperiods):
+    """Returns the annual interest rate for each period of a loan
+
+    :param interest_rate: One of
+        a single annual rate for all periods,
+        an array (or list) with the annual rate of each period, where the last rate 
+            continues after the end of the array, or
+        a list of (date, rate) change points, where each rate applies from the first
+            period on or after its date, and the first rate also before its date.
+    :param start_date: Start date for the loan.
+    :param cyclesPerAnnum: Number of payment cycles in a year, see calendarfuns.periodcalendar.
+    :param numperiods: Number of periods required.
+
+    :return: 
+        rates: numpy array of numperiods annual rates
+    """
+    if np.ndim(interest_rate) == 0:
+        return np.full(numperiods, float(interest_rate))
+    interest_rate = list(interest_rate)
+    if len(interest_rate) == 0:
+        raise ValueError('Empty interest rate path')
+    if isinstance(interest_rate[0], (tuple, list)):
+        changedates, changerates = _changepoints(interest_rate)
+        dates, _, _ = cal.periodcalendar(start_date, cyclesPerAnnum, numperiods)
+        return changerates[np.maximum(np.searchsorted(changedates, dates, side='right') - 1, 0)]
+    rates = np.asarray(interest_rate, dtype=float)
+    return np.concatenate([rates[:numperiods], np.full(max(numperiods - rates.shape[0], 0), rates[-1])])
+
+
+# ============================================================================
+def amortise_ratepath(principal, interest_rate, bondyears, reqpayment, addpayment, start_date, 
+                      cyclesPerAnnum, addpayrate=0, recalcpayment=False, closedform=False, 
+                      doschedule=True, maxyears=200):
+    """
+    Calculate the amortization of a loan with an interest rate that changes over time.
+
+    The loan is evaluated one segment at a time, where a segment is a run of periods 
+    with the same interest rate and payments. With closedform, the periods in a segment
+    are calculated at once from the annuity formula, so that a 30-year loan with 40 rate
+    changes takes about 40 steps. The interest is then not rounded to cents every 
+    period, see amortise_summary. Without closedform the segments are stepped one period
+    at a time with the interest rounded to cents, giving the same numbers as 
+    amortise_arrays for a fixed rate.
+
+    :param principal: Amount borrowed
+    :param interest_rate: The annual interest rate path for this loan, see ratepath
+    :param bondyears: Number of years for the loan
+    :param reqpayment: Payment amount per period
+    :param addpayment: Initial value of additional payments to be made each period.
+    :param start_date: Start date for the loan.
+    :param cyclesPerAnnum: Number of payment cycles in a year, see calendarfuns.periodcalendar.
+    :param addpayrate: Rate of increase in additional payment, calculated once per year.
+    :param recalcpayment: Recalculate the required payment at every rate change, to pay off 
+        the loan over the remainder of bondyears. 
+    :param closedform: Use the annuity closed form within the segments. Default False.
+    :param doschedule: If False, no per-period values are stored.
+    :param maxyears: Give up if the loan is not paid off within this many years.
+
+    :return: 
+        schedule: Amortization schedule as an Ordered Dictionary of numpy arrays, including
+            the annual InterestRate of each period, None if doschedule is False
+        payoff_date: date of the final payment, as numpy datetime64
+        numpayments: number of payments
+        totinterest: total interest (negative)
+    """
+    # the horizon covers the term and the rate path, and is only extended if the loan is 
+    # not paid off within it
+    maxperiods = int(np.ceil(maxyears * cyclesPerAnnum))
+    horizon = bondyears * cyclesPerAnnum
+    if np.ndim(interest_rate) > 0:
+        path = list(interest_rate)
+        if len(path) > 0 and isinstance(path[0], (tuple, list)):
+            changedates, _ = _changepoints(path)
+            days = (changedates[-1] - np.datetime64(start_date, 'D')).astype(np.int64)
+            horizon = max(horizon, days / 365.25 * cyclesPerAnnum)
+        else:
+            horizon = max(horizon, len(path))
+    numperiods = min(int(np.ceil(horizon)) + 2, maxperiods)
+
+    while True:
+        result = _amortise_segments(principal, interest_rate, bondyears, reqpayment, addpayment, start_date,
+                                    cyclesPerAnnum, addpayrate, recalcpayment, closedform, doschedule, 
+                                    numperiods)
+        if result is not None:
+            return result
+        if numperiods >= maxperiods:
+            raise ValueError(f'Loan is not paid off within {maxyears} years')
+        numperiods = min(2 * numperiods, maxperiods)
+
+
+# ============================================================================
+def _amortise_segments(principal, interest_rate, bondyears, reqpayment, addpayment, start_date, 
+                       cyclesPerAnnum, addpayrate, recalcpayment, closedform, doschedule, numperiods):
+    """Runs amortise_ratepath over numperiods periods, returns None if the loan is not paid off
+    """
+    dates, _, newyear = cal.periodcalendar(start_date, cyclesPerAnnum, numperiods)
+    rates = ratepath(interest_rate, start_date, cyclesPerAnnum, numperiods)
+
+    # segments start at every rate change and, if the additional payment escalates, every new year
+    starts = np.flatnonzero(rates[1:] != rates[:-1]) + 1
+    if addpayrate != 0 and addpayment != 0:
+        starts = np.union1d(starts, np.flatnonzero(newyear))
+    starts = np.concatenate([[0], starts, [numperiods]]).astype(np.int64).tolist()
+
+    beg_balance = float(principal)
+    req = float(reqpayment)
+    add = float(addpayment)
+    termperiods = int(round(bondyears * cyclesPerAnnum))
+    totinterest = 0.
+    chunks = []
+
+    for s, e in zip(starts[:-1], starts[1:]):
+        rate = rates[s]
+        ratec = rate / cyclesPerAnnum
+        if newyear[s]:
+            add *= 1 + addpayrate
+        if recalcpayment and s > 0 and rate != rates[s - 1]:
+            # pay off the balance over what is left of the term, at the new rate
+            req = float(annuitypayment(beg_balance, ratec, termperiods - s, decimals=2))
+
+        # periods that can be taken at once, before the final period of the loan
+        jump = 0
+        if closedform:
+            payment = - (req + add)
+            jump = e - s
+            if ratec * beg_balance < payment:
+                if ratec == 0:
+                    numpayments = beg_balance / payment
+                else:
+                    numpayments = - np.log1p(- ratec * beg_balance / payment) / np.log1p(ratec)
+                jump = min(jump, max(int(np.ceil(numpayments)) - 2, 0))
+            growth = (1 + ratec) ** np.arange(jump + 1)
+            if ratec == 0:
+                begbal = beg_balance - payment * np.arange(jump + 1)
+            else:
+                begbal = beg_balance * growth - payment * (growth - 1) / ratec
+            if doschedule and jump > 0:
+                chunks.append((begbal[:-1], np.full(jump, req), np.full(jump, add), - ratec * begbal[:-1],
+                               begbal[1:], np.full(jump, rate)))
+            totinterest -= begbal[-1] - beg_balance + jump * payment
+            beg_balance = begbal[-1]
+
+        # the remaining periods one at a time, until the loan is paid off
+        for p in range(s + jump, e):
+            interest = - (ratec * beg_balance if closedform else round(ratec * beg_balance, 2))
+            owed = beg_balance - interest
+            end_balance = owed + req + add
+            final = end_balance <= 0 or owed < -req or owed + req < -add
+            reqpay, addpay = req, add
+            if final:
+                # the payments are reduced to what is left to pay off
+                reqpay = - min(-req, owed)
+                addpay = - min(-add, owed + reqpay)
+                end_balance = owed + reqpay + addpay
+            totinterest += interest
+            if doschedule:
+                chunks.append(([beg_balance], [reqpay], [addpay], [interest], [end_balance], [rate]))
+            if final:
+                columns = None
+                if doschedule:
+                    values = [np.concatenate([np.asarray(c[i], dtype=float) for c in chunks]) for i in range(6)]
+                    columns = OrderedDict(zip(['Begin Balance', 'ReqPayment', 'AddPayment', 'Interest', 
+                                               'End Balance', 'InterestRate'], values))
+                    columns['Period'] = np.arange(1, p + 2)
+                    columns['Month'] = dates[:p + 1]
+                    columns.move_to_end('Month', last=False)
+                    columns.move_to_end('Period', last=False)
+                return columns, dates[p], p + 1, totinterest
+            beg_balance = end_balance
+
+    return None
+
+
+# ============================================================================
+_amortstatsindex = pd.Index(["Principal","Payoff Date", "Num Payments", "Interest Rate", "BondYears", 
+                             "ReqPayment", "AddPayment", "Addpayrate","Total Interest","ID"])
 
-            
 
 # ============================================================================
 def amortisation_table(principal, interest_rate, bondyears,reqpayment,
-                       addpayment=0, cyclesPerAnnum=12, start_date=(date(2000,1,1)),addpayrate=0,ID=''):
+                       addpayment=0, cyclesPerAnnum=12, start_date=(date(2000,1,1)),addpayrate=0,ID='',
+                       summary_only=False, recalcpayment=False, closedform=False):
     """
     Calculate the amortization schedule given the loan details as well as summary stats for the loan
 
@@ -97,6 +486,16 @@ def amortisation_table(principal, interest_rate, bondyears,reqpayment,
     :param addpayment (optional): Additional payments to be made each period. ** See note below. Default 0. (negative)
     :param start_date (optional): Start date. Default 2000-01-01 if none provided
     :param addpayrate: Rate of increase in additional payment, calculated once per year.
+    :param summary_only (optional): Only calculate the summary, see amortise_summary. Default False.
+    :param recalcpayment (optional): With a rate path, recalculate the required payment at every 
+        rate change, see amortise_ratepath. Default False.
+    :param closedform (optional): Use the annuity closed form, see amortise_ratepath and 
+        amortise_summary. This is faster, but the interest is not rounded to cents every period. 
+        Default False, for the same numbers as the schedule.
+
+    The interest rate can also be given as a path, either as an array of annual rates per 
+    period or as a list of (date, rate) change points, see ratepath. The schedule then has
+    the rate of each period in the InterestRate column, and the summary has the first rate.
 
     The additional payment can be specified as a money value or as a fraction  
     of the required payment. Complex value notation is used where the money value 
@@ -105,7 +504,7 @@ def amortisation_table(principal, interest_rate, bondyears,reqpayment,
     (money value) is given the (positive) imaginary component (fraction value) is ignored.
 
     :return: 
-        schedule: Amortization schedule as a pandas dataframe
+        schedule: Amortization schedule as a pandas dataframe, None if summary_only
         summary: Pandas dataframe that summarizes the payoff information
     """
     
@@ -116,12 +515,36 @@ def amortisation_table(principal, interest_rate, bondyears,reqpayment,
     else:
         addpayment = 0
     
-    # Generate the schedule 
-    schedule = pd.DataFrame(amortise(principal, interest_rate, bondyears, reqpayment,
-                                     addpayment, start_date, cyclesPerAnnum,addpayrate=addpayrate,
-                                    ID=ID))
-    
-    if schedule.empty:
+    if principal > 0 and (np.ndim(interest_rate) > 0 or (closedform and not summary_only)):
+        columns, payoff_date, numpayments, totinterest = amortise_ratepath(principal, interest_rate, bondyears, 
+                        reqpayment, addpayment, start_date, cyclesPerAnnum, addpayrate=addpayrate, 
+                        recalcpayment=recalcpayment, closedform=closedform,
+                        doschedule=not summary_only)
+        interest_rate = ratepath(interest_rate, start_date, cyclesPerAnnum, 1)[0]
+        if columns is not None:
+            totinterest = columns["Interest"].sum()
+        stats = pd.Series([principal,pd.Timestamp(payoff_date), numpayments, interest_rate,
+                           bondyears, reqpayment, addpayment,addpayrate,
+                           totinterest,ID],
+                           index=_amortstatsindex)
+        if summary_only:
+            return None, stats
+        columns['Principal'] = np.full(numpayments, principal)
+        columns.move_to_end('InterestRate')
+        columns['ID'] = [ID] * numpayments
+        return pd.DataFrame(columns, copy=False), stats
+
+    if summary_only and principal > 0:
+        payoff_date, numpayments, totinterest = amortise_summary(principal, interest_rate, bondyears, reqpayment,
+                                                    addpayment, start_date, cyclesPerAnnum, addpayrate=addpayrate,
+                                                    closedform=closedform)
+        stats = pd.Series([principal,pd.Timestamp(payoff_date), numpayments, interest_rate,
+                           bondyears, reqpayment, addpayment,addpayrate,
+                           totinterest,ID],
+                           index=_amortstatsindex)
+        return None, stats
+
+    if principal <= 0:
         stats = pd.Series([0,start_date, 0, interest_rate,
                    0, 0, 0,0,0,ID],
                    index=["Principal","Payoff Date", "Num Payments", "Interest Rate", "BondYears", 
@@ -129,50 +552,522 @@ def amortisation_table(principal, interest_rate, bondyears,reqpayment,
 
         return None, stats
 
-    # reorder the columns
-    schedule = schedule[["Period", "Month", "Begin Balance", "ReqPayment","AddPayment",
-                         "Interest", "End Balance",'Principal','InterestRate','ID']]
+    # Generate the schedule columns
+    columns = amortise_arrays(principal, interest_rate, bondyears, reqpayment,
+                              addpayment, start_date, cyclesPerAnnum, addpayrate=addpayrate)
 
-    # Convert to a pandas datetime object to make subsequent calcs easier
-    schedule["Month"] = pd.to_datetime(schedule["Month"])
+    # Build the frame once, in the final column order
+    numperiods = columns['Period'].shape[0]
+    columns['Principal'] = np.full(numperiods, principal)
+    columns['InterestRate'] = np.full(numperiods, interest_rate)
+    columns['ID'] = [ID] * numperiods
+    schedule = pd.DataFrame(columns, copy=False)
     
     #Create a summary statistics table
-    payoff_date = schedule["Month"].iloc[-1]
-    stats = pd.Series([principal,payoff_date, schedule["Period"].count(), interest_rate,
+    payoff_date = pd.Timestamp(columns["Month"][-1])
+    stats = pd.Series([principal,payoff_date, numperiods, interest_rate,
                        bondyears, reqpayment, addpayment,addpayrate,
-                       schedule["Interest"].sum(),ID],
-                       index=["Principal","Payoff Date", "Num Payments", "Interest Rate", "BondYears", 
-                             "ReqPayment", "AddPayment", "Addpayrate","Total Interest","ID"])
+                       columns["Interest"].sum(),ID],
+                       index=_amortstatsindex)
     
     return schedule, stats
 
 
+# ============================================================================
+def _amortise_loans(principal, rate, reqpayment, addpayment, payrate, newyear, interestfn, escalatefn, 
+                    doschedule=True, paymentfn=None, giveup=False):
+    """Steps many loans forward together, one period at a time, until all are paid off
+
+    The loans still running are kept in compressed arrays, which are only reduced when
+    some loans are paid off, and the period values are calculated in place in preallocated
+    work arrays. The rounding of the interest and of the escalated additional payment is 
+    left to the caller, so that the same loop serves floats and int64 cents.
+
+    :param principal: Amounts borrowed (positive)
+    :param rate: Per-loan rate passed to interestfn, or (loan x period) rates for rates that change
+        over time, where the last period's rate continues after the end of the array
+    :param reqpayment: Required payments (negative)
+    :param addpayment: Additional payments (negative)
+    :param payrate: Per-loan rate passed to escalatefn
+    :param newyear: True for the periods that start a new calendar year, see calendarfuns.periodcalendar
+    :param interestfn: interestfn(balance, rate, out) writes the (negative) interest for the period into out
+    :param escalatefn: escalatefn(addpayment, payrate) returns the additional payment for the new year
+    :param doschedule: If False, no per-period values are stored.
+    :param paymentfn: paymentfn(balance, rate, loans, period) returns the required payments of the 
+        given loans, recalculated when their rate changes. None to keep the required payments.
+    :param giveup: If True, loans not paid off within newyear get numpay -1, instead of raising
+        a ValueError.
+
+    :return: 
+        numpay: number of payments per loan, -1 for loans not paid off with giveup
+        totinterest: total interest per loan, up to the end of newyear for loans not paid off
+        columns: Ordered Dictionary of (loan x period) arrays of the schedules, or None if doschedule is False
+    """
+    numloans = principal.shape[0]
+    numpay = np.zeros(numloans, dtype=np.int64)
+    totinterest = np.zeros(numloans, dtype=principal.dtype)
+    columns = None
+    if doschedule:
+        capacity = 64
+        columns = OrderedDict((key, np.zeros((numloans, capacity), dtype=principal.dtype)) for key in 
+                              ['Begin Balance', 'ReqPayment', 'AddPayment', 'Interest', 'End Balance'])
+
+    # rates that change over time are taken from the paths of the loans still running
+    paths = None
+    if rate.ndim == 2:
+        paths, rate = rate, rate[:, 0]
+
+    loans = np.nonzero(principal > 0)[0]
+    numactive = loans.shape[0]
+    rate, req, add, payrate = [v[loans] for v in (rate, reqpayment, addpayment, payrate)]
+    totint = np.zeros(numactive, dtype=principal.dtype)
+
+    # work arrays: the balance alternates between the two balance arrays
+    balances = np.empty((2, numactive), dtype=principal.dtype)
+    interest, owed, reqpay, addpay = np.empty((4, numactive), dtype=principal.dtype)
+    k = 0
+    balances[k] = principal[loans]
+    p = 0
+    while numactive > 0:
+        if p >= newyear.shape[0]:
+            if not giveup:
+                raise ValueError(f'Loan is not paid off within {newyear.shape[0]} periods')
+            numpay[loans] = -1
+            totinterest[loans] = totint
+            break
+        # only increase the additional payment once per year
+        if newyear[p]:
+            add = escalatefn(add, payrate)
+
+        beg_balance, end_balance = balances[k, :numactive], balances[1-k, :numactive]
+        ints, own, req_, add_ = interest[:numactive], owed[:numactive], reqpay[:numactive], addpay[:numactive]
+        if paths is not None:
+            rate = paths[loans, min(p, paths.shape[1] - 1)]
+            if paymentfn is not None and 0 < p < paths.shape[1]:
+                changed = rate != paths[loans, p - 1]
+                if changed.any():
+                    req[changed] = paymentfn(beg_balance[changed], rate[changed], loans[changed], p)
+        interestfn(beg_balance, rate, ints)
+        np.subtract(beg_balance, ints, out=own)
+        # the payments are reduced to what is left to pay off in the final period
+        np.negative(own, out=end_balance)
+        np.maximum(req, end_balance, out=req_)
+        np.add(own, req_, out=end_balance)
+        np.negative(end_balance, out=add_)
+        np.maximum(add, add_, out=add_)
+        end_balance += add_
+        totint += ints
+
+        if doschedule:
+            if p >= capacity:
+                columns = OrderedDict((key, np.concatenate([val, np.zeros_like(val)], axis=1)) 
+                                      for key, val in columns.items())
+                capacity *= 2
+            for key, val in zip(columns.keys(), (beg_balance, req_, add_, ints, end_balance)):
+                columns[key][loans, p] = val
+        p += 1
+
+        # drop the loans paid off in this period
+        active = end_balance > 0
+        if active.all():
+            k = 1 - k
+        else:
+            done = ~active
+            numpay[loans[done]] = p
+            totinterest[loans[done]] = totint[done]
+            loans, rate, req, add, payrate, totint = [v[active] for v in (loans, rate, req, add, payrate, totint)]
+            numactive = loans.shape[0]
+            balances[k, :numactive] = end_balance[active]
+
+    return numpay, totinterest, columns
+
+
+# ============================================================================
+# fixed-point scale for rates in the integer cents kernel, i.e. rates are resolved to 1e-8
+ratescale = 10**8
+
+
+# ============================================================================
+def annuitypayment(balance, ratec, numperiods, decimals=None):
+    """Returns the (negative) payment that pays off balance in numperiods at the rate per period ratec
+
+    At least one period is used, and a zero rate pays off the balance in equal parts.
+    With decimals the payment is rounded, but to at least one unit of the last decimal, so
+    that a balance of a fraction of a cent is still paid off.
+    """
+    numperiods = np.maximum(numperiods, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        payment = np.where(ratec == 0, balance / numperiods, balance * ratec / (1 - (1 + ratec) ** -numperiods))
+    if decimals is not None:
+        payment = np.maximum(np.round(payment, decimals), 10.**-decimals)
+    return - payment
+
+
+# ============================================================================
+def roundeddivide(numer, denom, rounding='half-even', nonnegative=False):
+    """Integer division of int64 numer by the positive integer denom, rounded to the nearest integer
+
+    The division is done as a single floor division, with ties detected exactly.
+
+    :param numer: numerator, int64 array or scalar
+    :param denom: denominator, positive integer
+    :param rounding: 'half-even' (bankers' rounding) or 'half-up' (half away from zero)
+    :param nonnegative: skip the sign handling if numer is known to be non-negative
+
+    :return: 
+        quotient as int64, with ties rounded as specified
+    """
+    magnitude = numer if nonnegative else np.abs(numer)
+    shifted = 2 * magnitude + denom
+    quot = shifted // (2 * denom)
+    if rounding == 'half-even':
+        quot -= (quot * (2 * denom) == shifted) & (quot & 1 == 1)
+    elif rounding != 'half-up':
+        raise ValueError(f"Unknown rounding = {rounding}, use 'half-even' or 'half-up'")
+    return quot if nonnegative else np.where(numer < 0, -quot, quot)
+
+
+# ============================================================================
+def amortise_cents(principal, interest_rate, reqpayment, addpayment, addpayrate, newyear, 
+                   cyclesPerAnnum, rounding='half-even', doschedule=True, termperiods=None, giveup=False,
+                   usejit=None):
+    """
+    Amortise many loans with all money values as int64 cents
+
+    The interest is calculated in integer arithmetic from the rates in fixed point
+    (see ratescale) and rounded to cents with the given rounding mode, so that the 
+    results are exact and identical between runs and machines. The escalated 
+    additional payment is also rounded to cents, once per year.
+
+    :param principal: Amounts borrowed in cents (positive), int64 array
+    :param interest_rate: The *annual* interest rates (positive), float array, or 
+        (loan x period) float array of rates that change over time, see _amortise_loans
+    :param reqpayment: Required payments in cents (negative), int64 array
+    :param addpayment: Additional payments in cents (negative), int64 array
+    :param addpayrate: Rates of increase in additional payment, calculated once per year, float array
+    :param newyear: True for the periods that start a new calendar year, see calendarfuns.periodcalendar
+    :param cyclesPerAnnum: Number of payment cycles in a year.
+    :param rounding: 'half-even' (bankers' rounding) or 'half-up'
+    :param doschedule: If False, no per-period values are stored.
+    :param termperiods: With rates that change over time, the number of periods over which each
+        loan must be paid off, to recalculate its required payment when its rate changes. 
+        None to keep the required payments.
+    :param giveup: If True, loans not paid off within newyear get numpay -1, see _amortise_loans.
+    :param usejit: Use the compiled kernel in jitfuns for rates that do not change over time,
+        if numba is installed. None to use it whenever it is available.
+
+    :return: 
+        numpay: number of payments per loan
+        totinterest: total interest per loan in cents
+        columns: Ordered Dictionary of (loan x period) int64 arrays of the schedules in 
+            cents, or None if doschedule is False
+    """
+
+    ratenum = np.round(interest_rate * ratescale).astype(np.int64)
+    paynum = np.round((1 + addpayrate) * ratescale).astype(np.int64)
+    denom = int(round(ratescale * cyclesPerAnnum))
+    if rounding not in ('half-even', 'half-up'):
+        raise ValueError(f"Unknown rounding = {rounding}, use 'half-even' or 'half-up'")
+    if np.min(ratenum, initial=0) < 0:
+        raise ValueError('Negative interest rates are not supported by the int64 cents kernel')
+    if int(np.max(principal, initial=0)) * int(np.max(ratenum, initial=0)) >= 2**61:
+        raise ValueError('Principal and interest rate too large for the int64 cents kernel')
+
+    if usejit is not False and jit.havejit and ratenum.ndim == 1 and termperiods is None \
+            and not (giveup and doschedule):
+        numpay, totinterest, cols = jit.amortise_cents_loans(principal, ratenum, denom, reqpayment, addpayment,
+                                                             paynum, ratescale, rounding == 'half-even', 
+                                                             newyear, doschedule)
+        if not giveup and np.any(numpay < 0):
+            raise ValueError(f'Loan is not paid off within {newyear.shape[0]} periods')
+        columns = OrderedDict(zip(['Begin Balance', 'ReqPayment', 'AddPayment', 'Interest', 'End Balance'], 
+                                  cols)) if doschedule else None
+        return numpay, totinterest, columns
+
+    shiftedbuf, checkbuf = np.empty((2, principal.shape[0]), dtype=np.int64)
+    tiesbuf = np.empty(principal.shape[0], dtype=bool)
+
+    def interestfn(balance, rate, out):
+        # out = - round(balance * rate / denom), the same as roundeddivide but in place
+        shifted, check, ties = shiftedbuf[:out.shape[0]], checkbuf[:out.shape[0]], tiesbuf[:out.shape[0]]
+        np.multiply(balance, rate, out=shifted)
+        shifted *= 2
+        shifted += denom
+        # floor_divide by a scalar is several times faster than np.divmod
+        np.floor_divide(shifted, 2 * denom, out=out)
+        if rounding == 'half-even':
+            np.multiply(out, 2 * denom, out=check)
+            np.equal(check, shifted, out=ties)
+            if ties.any():
+                out[ties] -= out[ties] & 1
+        np.negative(out, out=out)
+
+    escalatefn = lambda add, rate: roundeddivide(add * rate, ratescale, rounding)
+    paymentfn = None
+    if termperiods is not None:
+        paymentfn = lambda balance, rate, loans, p: annuitypayment(balance, rate / denom, termperiods[loans] - p,
+                                                                   decimals=0).astype(np.int64)
+    return _amortise_loans(principal, ratenum, reqpayment, addpayment, paynum, newyear, 
+                           interestfn, escalatefn, doschedule=doschedule, paymentfn=paymentfn, giveup=giveup)
+
+
+# ============================================================================
+def amortisation_batch(principal, interest_rate, bondyears, reqpayment, addpayment=0, 
+                       addpayrate=0, cyclesPerAnnum=12, start_date=(date(2000,1,1)), ID='',
+                       doschedule=True, maxyears=200, rounding=None, incents=False, usejit=None,
+                       ratepaths=None, recalcpayment=False, giveup=False):
+    """
+    Calculate the amortization schedules and summary stats for many loans in one call
+
+    All loans are stepped forward together, one period at a time, as arrays over the 
+    loans. Loans drop out of the calculation once they are paid off.
+
+    :param principal: Amounts borrowed (positive), array or scalar
+    :param interest_rate: The *annual* interest rates (positive), array or scalar
+    :param bondyears: Number of years for the loans (positive), array or scalar
+    :param reqpayment: minimum required payments to meet the term requirements (negative), array or scalar
+    :param addpayment (optional): Additional payments, in the complex notation used by amortisation_table. Default 0.
+    :param addpayrate (optional): Rates of increase in additional payment, calculated once per year.
+    :param cyclesPerAnnum (optional): Number of payment cycles in a year, common to all loans, 
+        see calendarfuns.periodcalendar. Default 12.
+    :param start_date (optional): Start date, common to all loans. Default 2000-01-01.
+    :param ID (optional): String ID for each loan, array or scalar.
+    :param doschedule (optional): If False, only the summary stats are calculated and no 
+        per-period values are stored. Default True.
+    :param maxyears (optional): Give up if a loan is not paid off within this many years.
+    :param rounding (optional): None to calculate in floating point, or 'half-even' or 'half-up'
+        to calculate in int64 cents with that rounding mode, see amortise_cents. Default None.
+    :param incents (optional): With rounding, return the money values as int64 cents. Default False.
+    :param usejit (optional): Use the compiled kernels in jitfuns, if numba is installed. 
+        None to use them whenever they are available. Not used with ratepaths. Default None.
+    :param ratepaths (optional): The *annual* interest rate of each loan in each period, as 
+        (loan x period) array, where the last rate continues after the end of the paths.
+        The interest_rate is then taken from the first period of the paths. Default None.
+    :param recalcpayment (optional): With ratepaths, recalculate the required payment whenever the 
+        rate of a loan changes, to pay off the loan over the remainder of bondyears. The payment is
+        rounded to cents. Default False.
+    :param giveup (optional): If True, loans not paid off within maxyears are reported with
+        Num Payments -1, no Payoff Date (NaT) and NaN Total Interest, and have no schedule, 
+        instead of raising a ValueError. Default False.
+
+    The parameters are broadcast against each other, so that a scalar applies to all loans.
+    In floating point the interest is rounded to cents with np.round, which can differ by 
+    one cent from amortisation_table when the interest falls exactly on a half cent.
+
+    :return: 
+        schedule: Amortization schedules of all loans as one long-format pandas dataframe, with 
+            the loan number in the 'Loan' column, or None if doschedule is False
+        summary: Pandas dataframe with one row of payoff information per loan
+    """
+
+    if ratepaths is not None:
+        ratepaths = np.asarray(ratepaths, dtype=float)
+        interest_rate = ratepaths[..., 0]
+    principal, interest_rate, bondyears, reqpayment, addpayment, addpayrate, ID = \
+        np.broadcast_arrays(np.asarray(principal, dtype=float), np.asarray(interest_rate, dtype=float),
+                            np.asarray(bondyears), np.asarray(reqpayment, dtype=float), 
+                            np.asarray(addpayment), np.asarray(addpayrate, dtype=float),
+                            np.asarray(ID, dtype=object))
+    principal, interest_rate, bondyears, reqpayment, addpayment, addpayrate, ID = \
+        [np.ravel(v) for v in (principal, interest_rate, bondyears, reqpayment, addpayment, addpayrate, ID)]
+
+    # the complex notation for the additional payment, for all loans at once
+    addpayment = np.where(np.real(addpayment) != 0, np.real(addpayment), 
+                          reqpayment * np.imag(addpayment)).astype(float)
+
+    dates, _, newyear = cal.periodcalendar(start_date, cyclesPerAnnum, int(maxyears * cyclesPerAnnum) + 1)
+
+    rates = interest_rate
+    if ratepaths is not None:
+        rates = np.broadcast_to(ratepaths, interest_rate.shape + ratepaths.shape[-1:])
+
+    termperiods = None
+    if ratepaths is not None and recalcpayment:
+        termperiods = np.round(bondyears * cyclesPerAnnum).astype(np.int64)
+
+    if rounding is None and usejit is not False and jit.havejit and ratepaths is None and not (giveup and doschedule):
+        numpay, totinterest, cols = jit.amortise_loans(principal, interest_rate / cyclesPerAnnum, reqpayment, 
+                                                       addpayment, 1 + addpayrate, newyear, doschedule)
+        if not giveup and np.any(numpay < 0):
+            raise ValueError(f'Loan is not paid off within {maxyears} years')
+        columns = OrderedDict(zip(['Begin Balance', 'ReqPayment', 'AddPayment', 'Interest', 'End Balance'], 
+                                  cols)) if doschedule else None
+    elif rounding is None:
+        def interestfn(balance, ratec, out):
+            np.multiply(ratec, balance, out=out)
+            np.round(out, 2, out=out)
+            np.negative(out, out=out)
+
+        escalatefn = lambda add, rate: add * rate
+        paymentfn = None
+        if termperiods is not None:
+            paymentfn = lambda balance, ratec, loans, p: annuitypayment(balance, ratec, termperiods[loans] - p,
+                                                                        decimals=2)
+        numpay, totinterest, columns = _amortise_loans(principal, rates / cyclesPerAnnum, reqpayment, 
+                                                       addpayment, 1 + addpayrate, newyear, interestfn, escalatefn,
+                                                       doschedule=doschedule, paymentfn=paymentfn, giveup=giveup)
+    else:
+        tocents = lambda value: np.round(value * 100).astype(np.int64)
+        principal, reqpayment, addpayment = tocents(principal), tocents(reqpayment), tocents(addpayment)
+        numpay, totinterest, columns = amortise_cents(principal, rates, reqpayment, addpayment, 
+                                                      addpayrate, newyear, cyclesPerAnnum, 
+                                                      rounding=rounding, doschedule=doschedule, 
+                                                      termperiods=termperiods, giveup=giveup, usejit=usejit)
+        if not incents:
+            principal, reqpayment, addpayment = principal / 100, reqpayment / 100, addpayment / 100
+            totinterest = totinterest / 100
+            if doschedule:
+                columns = OrderedDict((key, val / 100) for key, val in columns.items())
+
+    return _batchframes(numpay, totinterest, columns, dates, principal, interest_rate, bondyears,
+                        reqpayment, addpayment, addpayrate, ID, start_date, ratepaths=ratepaths)
+
+
+# ============================================================================
+def _batchframes(numpay, totinterest, columns, dates, principal, interest_rate, bondyears,
+                 reqpayment, addpayment, addpayrate, ID, start_date, ratepaths=None):
+    """Returns the long-format schedule and the stats frames of amortisation_batch
+
+    columns is an Ordered Dictionary of (loan x period) arrays, or None for no schedule.
+    ratepaths are the (loan x period) rates if the rates change over time.
+    """
+    payoff = np.where(numpay > 0, dates[np.maximum(numpay - 1, 0)], np.datetime64(start_date, 'D'))
+    if np.any(numpay < 0):
+        # loans not paid off have no payoff date and no total interest
+        payoff = np.where(numpay < 0, np.datetime64('NaT'), payoff)
+        totinterest = np.where(numpay < 0, np.nan, totinterest)
+    stats = pd.DataFrame(OrderedDict([('Principal', np.where(numpay != 0, principal, 0)),
+                                      ('Payoff Date', payoff),
+                                      ('Num Payments', numpay),
+                                      ('Interest Rate', interest_rate),
+                                      ('BondYears', bondyears),
+                                      ('ReqPayment', reqpayment),
+                                      ('AddPayment', addpayment),
+                                      ('Addpayrate', addpayrate),
+                                      ('Total Interest', totinterest),
+                                      ('ID', ID),
+                                     ]))
+    if columns is None:
+        return None, stats
+
+    # long format: only the periods where each loan is still running, loan by loan
+    capacity = next(iter(columns.values())).shape[1]
+    loanidx, periodidx = np.nonzero(np.arange(capacity) < numpay[:, np.newaxis])
+    schedule = OrderedDict([('Loan', loanidx),
+                            ('Period', periodidx + 1),
+                            ('Month', dates[periodidx]),
+                           ])
+    for key, val in columns.items():
+        schedule[key] = val[loanidx, periodidx]
+    schedule['Principal'] = principal[loanidx]
+    if ratepaths is None:
+        schedule['InterestRate'] = interest_rate[loanidx]
+    else:
+        ratepaths = np.broadcast_to(ratepaths, principal.shape + ratepaths.shape[-1:])
+        schedule['InterestRate'] = ratepaths[loanidx, np.minimum(periodidx, ratepaths.shape[1] - 1)]
+    schedule['ID'] = ID[loanidx]
+    schedule = pd.DataFrame(schedule, copy=False)
+
+    return schedule, stats
+
+
+
 
             
 
+# ============================================================================
+# escalation factors already calculated, keyed on (rate, start_date, cyclesPerAnnum),
+# least recently used first
+_escalations = {}
+_maxescalations = 1024
+
+
+# ============================================================================
+def escalationfactors(increasepyear, numcycles, start_date=date(2000,1,1), cyclesPerAnnum=12):
+    """Returns the factors (1 + increasepyear) ** yearidx for numcycles periods
+
+    The value increases once per year (not every period) on January 01 at the stated 
+    annual rate. The factors are calculated once per 
+    (rate, start_date, cyclesPerAnnum) for a horizon of at least numcycles and shared 
+    by all later calls. A scalar rate receives a read-only view of the shared factors.
+
+    :param increasepyear: The annual rates of increase, array or scalar
+    :param numcycles: Number of periods required.
+    :param start_date: Date of the first period.
+    :param cyclesPerAnnum: Number of cycles in a year, see calendarfuns.periodcalendar.
+
+    :return: (rates x numcycles) array of factors, or a (numcycles) array for a scalar rate
+    """
+    rates = np.asarray(increasepyear, dtype=float)
+    numcycles = max(int(numcycles), 0)
+    unique, inverse = np.unique(rates.ravel(), return_inverse=True)
+    factors = [np.empty(numcycles)] if unique.shape[0] == 0 else []
+    for rate in unique:
+        key = (rate.item(), date(start_date.year, start_date.month, start_date.day), cyclesPerAnnum)
+        ratefactors = _escalations.pop(key, None)
+        if ratefactors is None or ratefactors.shape[0] < numcycles:
+            # at least 512 periods, so that a longer horizon is rarely recalculated
+            _, yearidx, _ = cal.periodcalendar(start_date, cyclesPerAnnum, max(numcycles, 512))
+            ratefactors = ((1 + rate) ** np.arange(yearidx[-1] + 1))[yearidx]
+            ratefactors.flags.writeable = False
+        _escalations[key] = ratefactors
+        if len(_escalations) > _maxescalations:
+            del _escalations[next(iter(_escalations))]
+        factors.append(ratefactors[:numcycles])
+    if rates.ndim == 0:
+        return factors[0]
+    return np.stack(factors)[inverse].reshape(rates.shape + (numcycles,))
+
+
+# ============================================================================
+def escalation_arrays(value, increasepyear, numcycles, start_date=date(2000,1,1), cyclesPerAnnum=12):
+    """Returns any number of values increasing at fixed annual rates, as arrays over periods
+
+    The values and rates are broadcast against each other, and each series is 
+    value * (1 + increasepyear) ** yearidx over a shared calendar.
+
+    :param value: Initial values, array or scalar
+    :param increasepyear: The annual rates of increase, array or scalar
+    :param numcycles: Number of periods.
+    :param start_date: Date of the first period.
+    :param cyclesPerAnnum: Number of cycles in a year, see calendarfuns.periodcalendar.
+
+    :return:
+        dates: period dates as numpy datetime64[D] array
+        values: (series x numcycles) array, or a (numcycles) array for scalar inputs
+    """
+    value, rates = np.broadcast_arrays(np.asarray(value, dtype=float), np.asarray(increasepyear, dtype=float))
+    dates, _, _ = cal.periodcalendar(start_date, cyclesPerAnnum, numcycles)
+    return dates, value[..., np.newaxis] * escalationfactors(rates, numcycles, start_date, cyclesPerAnnum)
+
+
 # ============================================================================
 # to calculate the annually increased value into a DataFrame
 def fixed_annualIncrease(value, increasepyear, numcycles, date, colhead='Value'):
-    """Yields an OrderedDict for a value increasing at a fixed ratem
+    """Yields an OrderedDict for a value increasing at a fixed rate
     
     Calculates the value increasing once per year (not every month) on January 01
-    at the stated annual rate.
+    at the stated annual rate, see escalation_arrays.
     """
+    dates, values = escalation_arrays(value, increasepyear, numcycles, date)
+    for p, (month, val) in enumerate(zip(dates.tolist(), values.tolist()), start=1):
+        yield OrderedDict([('Month', month), ('Period', p), (colhead, val)])
 
-    p = 1
-    currentyear = date.year
 
-    while p < numcycles + 1:      
-        yield OrderedDict([('Month',date),('Period', p),(colhead, value)])  
-        # Increment the counter, balance and date
-        p += 1
-        date += relativedelta(months=1)
-        # only increase the value once per year
-        if date.year != currentyear:
-            currentyear = date.year
-            value *= 1 + increasepyear
+# ============================================================================
+def escalationTable(values, increasepyears, colheads, numcycles, start_date=date(2000,1,1)):
+    """Returns one dataframe with a column for each initial value increasing at a fixed rate
+
+    Calculates the values increasing once per year (not every month) on January 01
+    at the stated annual rates, all in one call to escalation_arrays.
+    """
+    dates, values = escalation_arrays(np.ravel(values), np.ravel(increasepyears), numcycles, start_date)
+    columns = OrderedDict([('Month', dates), ('Period', np.arange(1, numcycles + 1))])
+    for colhead, column in zip(colheads, values):
+        columns[colhead] = column
+    return pd.DataFrame(columns)
+
 
-            
 # ============================================================================
 def annIncreaseTable(value, increasepyear, numcycles, start_date=date(2000,1,1),colhead='Rent'):
     """Returns a dataframe for an initial value increasing at a fixed rate for a term
@@ -180,14 +1075,7 @@ def annIncreaseTable(value, increasepyear, numcycles, start_date=date(2000,1,1),
     Calculates the value increasing once per year (not every month) on January 01
     at the stated annual rate.
     """
-    
-    # Generate the rent income schedule 
-    rischedule = pd.DataFrame(fixed_annualIncrease(value, increasepyear, numcycles,start_date,colhead=colhead))
-    
-    # Convert to a pandas datetime object to make subsequent calcs easier
-    rischedule["Month"] = pd.to_datetime(rischedule["Month"])
-
-    return rischedule
+    return escalationTable([value], [increasepyear], [colhead], numcycles, start_date)
 
 
 # ============================================================================
@@ -203,7 +1091,7 @@ def investmentgrowth(initialvalue, growthrate, termyears, addpayment=0, addpayme
     :param addpaymentrate: growth in the additional investment compounded annually 
     :param costBalPcnt: managment cost as percentage on balance
     :param start_date: Start date for the loan.
-    :param cyclesPerAnnum: Number of investment payment cycles in a year.
+    :param cyclesPerAnnum: Number of investment payment cycles in a year, see calendarfuns.periodcalendar.
     :param ID: String ID for this calculation.
 
     :return: 
@@ -214,10 +1102,14 @@ def investmentgrowth(initialvalue, growthrate, termyears, addpayment=0, addpayme
     p = 1
     beg_balance = initialvalue
     end_balance = initialvalue
-    currentyear = start_date.year
+    dates, _, newyear = cal.periodcalendar(start_date, cyclesPerAnnum, np.ceil(termyears * cyclesPerAnnum))
 
     while p < termyears * cyclesPerAnnum:
         
+        # only increase the additional payment once per year
+        if newyear[p-1]:
+            addpayment *= 1 + addpaymentrate
+
         # Recalculate the growth based on the current balance
         growth = - beg_balance * growthrate / cyclesPerAnnum
         
@@ -229,7 +1121,7 @@ def investmentgrowth(initialvalue, growthrate, termyears, addpayment=0, addpayme
         
         end_balance = beg_balance - growth + addpayment - costs
 
-        yield OrderedDict([('Month',start_date),
+        yield OrderedDict([('Month',dates[p-1].item()),
                            ('Period', p),
                            ('Begin Balance', beg_balance),
                            ('InitialVal', initialvalue),
@@ -243,26 +1135,268 @@ def investmentgrowth(initialvalue, growthrate, termyears, addpayment=0, addpayme
                            ('ID', ID),
                           ])
         
-        # Increment the counter, balance and date
+        # Increment the counter and balance
         p += 1
-        if cyclesPerAnnum == 12:
-            start_date += relativedelta(months=1)
-        elif  cyclesPerAnnum == 365.25:
-            start_date += relativedelta(days=1)
-        else:
-            print(f'Unknown cyclesPerAnnum = {cyclesPerAnnum}')
-            return None
         beg_balance = end_balance
-        
-        # only increase the additional payment once per year
-        if start_date.year != currentyear:
-            currentyear = start_date.year
-            addpayment *= 1 + addpaymentrate
 
             
+# ============================================================================
+def _investyearblocks(initialvalue, growthrate, addpayment, addpaymentrate, costBalPcnt, yearidx, cyclesPerAnnum):
+    """Returns the begin and end balances and additional payments of investments, one year at a time
+
+    The parameters are broadcast against each other, and the returned arrays have the 
+    periods along an extra last axis. See investment_arrays.
+    """
+    initialvalue, growthrate, addpayment, addpaymentrate, costBalPcnt = \
+        [np.asarray(v, dtype=float)[..., np.newaxis] for v in np.broadcast_arrays(
+            initialvalue, growthrate, addpayment, addpaymentrate, costBalPcnt)]
+    numperiods = yearidx.shape[0]
+    numyears = int(yearidx[-1]) + 1 if numperiods > 0 else 0
+
+    # the additional payment escalated once per year, in the same order as the generator
+    addyear = np.empty(addpayment.shape[:-1] + (numyears,))
+    addyear[..., :1] = addpayment
+    addyear[..., 1:] = 1 + addpaymentrate
+    addyear = np.multiply.accumulate(addyear, axis=-1)
+
+    # first period and number of periods of each calendar year
+    yearstart = np.searchsorted(yearidx, np.arange(numyears))
+    yearlen = np.diff(np.append(yearstart, numperiods))
+    offset = np.arange(numperiods) - yearstart[yearidx]
+
+    # growth factor and annuity factor for 0 to a full year of periods
+    nettrate = (growthrate - costBalPcnt) / cyclesPerAnnum
+    steps = np.arange(max(np.max(yearlen, initial=0), 0) + 1)
+    power = (1 + nettrate) ** steps
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # (power - 1) / nettrate, without the cancellation for very small nett rates
+        annuity = np.where(nettrate != 0, np.expm1(steps * np.log1p(nettrate)) / nettrate, steps)
+
+    # step across the years only
+    yearbal = np.empty(addyear.shape[:-1] + (numyears + 1,))
+    yearbal[..., 0] = initialvalue[..., 0]
+    for year in range(numyears):
+        yearbal[..., year + 1] = (yearbal[..., year] * power[..., yearlen[year]] + 
+                                  addyear[..., year] * annuity[..., yearlen[year]])
+
+    beg_balance = yearbal[..., yearidx] * power[..., offset] + addyear[..., yearidx] * annuity[..., offset]
+    end_balance = np.concatenate([beg_balance[..., 1:], yearbal[..., -1:]], axis=-1) if numperiods > 0 \
+        else beg_balance
+    return beg_balance, end_balance, addyear[..., yearidx]
+
+
+# ============================================================================
+def investment_arrays(initialvalue, growthrate, termyears, addpayment=0, addpaymentrate=0, 
+                      costBalPcnt=0, start_date=(date(2000,1,1)), cyclesPerAnnum=12):
+    """
+    Calculate the investment schedule columns one calendar year at a time.
+
+    Within a calendar year the growth rate, cost and additional payment are constant, so
+    that the balances follow a geometric annuity at the nett rate (growth - cost) per 
+    period. The balance is only stepped from year to year, and the periods of all the 
+    years are then filled in at once from the annuity formula. This gives the numbers of 
+    the investmentgrowth generator, to within floating point rounding.
+
+    :param initialvalue: Initial value paid into the investment
+    :param growthrate: The annual growth rate for this investment
+    :param termyears: Number of years for the investment
+    :param addpayment: Additional investment amount per period
+    :param addpaymentrate: growth in the additional investment compounded annually 
+    :param costBalPcnt: managment cost as percentage on balance
+    :param start_date: Start date for the investment.
+    :param cyclesPerAnnum: Number of investment payment cycles in a year, see calendarfuns.periodcalendar.
+
+    :return: 
+        schedule: investment schedule as an Ordered Dictionary of numpy arrays
+    """
+
+    # investmentgrowth runs while period < termyears * cyclesPerAnnum
+    numperiods = max(int(np.ceil(termyears * cyclesPerAnnum)) - 1, 0)
+    dates, yearidx, _ = cal.periodcalendar(start_date, cyclesPerAnnum, numperiods)
+    beg_balance, end_balance, addpay = _investyearblocks(initialvalue, growthrate, addpayment, addpaymentrate,
+                                                         costBalPcnt, yearidx, cyclesPerAnnum)
+    return OrderedDict([('Period', np.arange(1, numperiods + 1)),
+                        ('Month', dates),
+                        ('Begin Balance', beg_balance),
+                        ('InitialVal', np.full(numperiods, initialvalue)),
+                        ('GrowthRate', np.full(numperiods, growthrate)),
+                        ('Growth', - beg_balance * growthrate / cyclesPerAnnum),
+                        ('costBalPcnt', np.full(numperiods, costBalPcnt)),
+                        ('CostBalance', beg_balance * costBalPcnt / cyclesPerAnnum),
+                        ('AddPayment', addpay),
+                        ('AddPayRate', np.full(numperiods, addpaymentrate)),
+                        ('End Balance', end_balance),
+                       ])
+
+
+# ============================================================================
+def _invest_scenarios(initialvalue, growthrate, addpayment, payrate, costBalPcnt, newyear, cyclesPerAnnum,
+                      numperiods, doschedule):
+    """Runs the investmentgrowth recurrence for many scenarios, as arrays over the scenarios
+
+    Gives the same numbers as investmentgrowth, see jitfuns.invest_scenarios for the 
+    parameters and the returned end balances and (5 x scenario x period) array.
+    """
+    endbalance = initialvalue.copy()
+    add = addpayment.copy()
+    cols = np.zeros((5, initialvalue.shape[0], newyear.shape[0] if doschedule else 0))
+    for p in range(newyear.shape[0]):
+        # only increase the additional payment once per year
+        if newyear[p]:
+            add *= payrate
+        beg_balance = endbalance
+        growth = - beg_balance * growthrate / cyclesPerAnnum
+        costBal = beg_balance * costBalPcnt / cyclesPerAnnum
+        # scenarios past their term keep their end balance
+        endbalance = np.where(p < numperiods, beg_balance - growth + add - costBal, beg_balance)
+        if doschedule:
+            cols[:, :, p] = beg_balance, growth, costBal, add, endbalance
+    return endbalance, cols
+
+
+# ============================================================================
+def investment_batch(initialvalue, growthrate, termyears, addpayment=0, addpaymentrate=0, costBalPcnt=0,
+                     start_date=(date(2000,1,1)), cyclesPerAnnum=12, ID='', doschedule=True, usejit=None):
+    """
+    Calculate the investment schedules and summary stats for many scenarios in one call
+
+    The parameters are broadcast against each other, so that a scalar applies to all scenarios.
+    The numbers are the same as those of investment_table with closedform=False for each scenario.
+
+    :param initialvalue: Initial values paid into the investments, array or scalar
+    :param growthrate: The annual growth rates, array or scalar
+    :param termyears: Number of years for the investments, array or scalar
+    :param addpayment: Additional investment amounts per period, array or scalar
+    :param addpaymentrate: growth in the additional investments compounded annually, array or scalar
+    :param costBalPcnt: managment costs as percentage on balance, array or scalar
+    :param start_date: Start date, common to all scenarios.
+    :param cyclesPerAnnum: Number of investment payments in a year, common to all scenarios.
+    :param ID: String ID for each scenario, array or scalar.
+    :param doschedule (optional): If False, only the summary stats are returned. Default True.
+    :param usejit (optional): Use the compiled kernel in jitfuns, if numba is installed. None to 
+        use it whenever it is available. Default None.
+
+    :return: 
+        schedule: investment schedules of all scenarios as one long-format pandas dataframe, with 
+            the scenario number in the 'Scenario' column, or None if doschedule is False
+        summary: Pandas dataframe with one row of investment_table stats per scenario
+    """
+    initialvalue, growthrate, termyears, addpayment, addpaymentrate, costBalPcnt, ID = \
+        [np.ravel(v) for v in np.broadcast_arrays(
+            np.asarray(initialvalue, dtype=float), np.asarray(growthrate, dtype=float), np.asarray(termyears), 
+            np.asarray(addpayment, dtype=float), np.asarray(addpaymentrate, dtype=float), 
+            np.asarray(costBalPcnt, dtype=float), np.asarray(ID, dtype=object))]
+
+    # investmentgrowth runs while period < termyears * cyclesPerAnnum
+    numperiods = np.maximum(np.ceil(termyears * cyclesPerAnnum).astype(np.int64) - 1, 0)
+    dates, _, newyear = cal.periodcalendar(start_date, cyclesPerAnnum, np.max(numperiods, initial=0))
+
+    kernel = jit.invest_scenarios if usejit is not False and jit.havejit else _invest_scenarios
+    endBalance, cols = kernel(initialvalue, growthrate, addpayment, 1 + addpaymentrate, costBalPcnt, newyear, 
+                              cyclesPerAnnum, numperiods, doschedule)
+
+    stats = pd.DataFrame(OrderedDict([('ID', ID),
+                                      ('InitialVal', initialvalue),
+                                      ('GrowthRate', growthrate),
+                                      ('Years', termyears),
+                                      ('AddPayment', addpayment),
+                                      ('AddPayRate', addpaymentrate),
+                                      ('EndBalance', endBalance),
+                                      ('CostBalPcnt', costBalPcnt),
+                                      ('NettGrowth', endBalance - initialvalue),
+                                     ]))
+    if not doschedule:
+        return None, stats
+
+    # long format: only the periods within the term of each scenario
+    scenidx, periodidx = np.nonzero(np.arange(cols.shape[2]) < numperiods[:, np.newaxis])
+    schedule = pd.DataFrame(OrderedDict([('Scenario', scenidx),
+                                         ('Period', periodidx + 1),
+                                         ('Month', dates[periodidx]),
+                                         ('Begin Balance', cols[0, scenidx, periodidx]),
+                                         ('InitialVal', initialvalue[scenidx]),
+                                         ('GrowthRate', growthrate[scenidx]),
+                                         ('Growth', cols[1, scenidx, periodidx]),
+                                         ('costBalPcnt', costBalPcnt[scenidx]),
+                                         ('CostBalance', cols[2, scenidx, periodidx]),
+                                         ('AddPayment', cols[3, scenidx, periodidx]),
+                                         ('AddPayRate', addpaymentrate[scenidx]),
+                                         ('End Balance', cols[4, scenidx, periodidx]),
+                                         ('ID', ID[scenidx]),
+                                         ('NettGrowth', cols[4, scenidx, periodidx] - initialvalue[scenidx]),
+                                        ]), copy=False)
+    return schedule, stats
+
+
+# ============================================================================
+def investment_sweep(initialvalue, growthrates, termyears, addpayments=(0,), addpaymentrates=(0,), 
+                     costBalPcnts=(0,), start_date=(date(2000,1,1)), cyclesPerAnnum=12, labelled=False):
+    """
+    Calculate the investment schedules over the full grid of the parameter values in one pass
+
+    The grid growthrates x addpayments x addpaymentrates x costBalPcnts is evaluated as 
+    arrays, one calendar year at a time as in investment_arrays, so that every grid point 
+    gives the same numbers as investment_table. The schedules share the period axis, which 
+    is the last axis of the cube. For example, the nett growth normalised to the end value 
+    without fees (with costBalPcnts[0] = 0) is a broadcast:
+
+        cube, axes = investment_sweep(1, [0.02, 0.06], 30, [0, 1000], costBalPcnts=[0, 0.01, 0.02])
+        normgrowth = cube['NettGrowth'] / cube['NettGrowth'][..., :1, -1:]
+
+    :param initialvalue: Initial value paid into the investments
+    :param growthrates: The annual growth rates, list or array
+    :param termyears: Number of years for the investments
+    :param addpayments: Additional investment amounts per period, list or array
+    :param addpaymentrates: growth in the additional investments compounded annually, list or array
+    :param costBalPcnts: managment costs as percentage on balance, list or array
+    :param start_date: Start date for the investments.
+    :param cyclesPerAnnum: Number of investment payment cycles in a year, see calendarfuns.periodcalendar.
+    :param labelled: Return the cube as pandas dataframes, with a row for each grid point 
+        labelled by its parameter values, and a column for each period. Default False.
+
+    :return: 
+        cube: Ordered Dictionary of 'Begin Balance', 'Growth', 'CostBalance', 'AddPayment', 
+            'End Balance' and 'NettGrowth', each as (growthrate x addpayment x addpaymentrate x 
+            costBalPcnt x period) numpy array, or as dataframe if labelled
+        axes: Ordered Dictionary of the values along each axis: 'GrowthRate', 'AddPayment', 
+            'AddPayRate', 'CostBalPcnt', and 'Period' and 'Month' for the period axis
+    """
+    axes = OrderedDict([('GrowthRate', np.ravel(np.asarray(growthrates, dtype=float))),
+                        ('AddPayment', np.ravel(np.asarray(addpayments, dtype=float))),
+                        ('AddPayRate', np.ravel(np.asarray(addpaymentrates, dtype=float))),
+                        ('CostBalPcnt', np.ravel(np.asarray(costBalPcnts, dtype=float))),
+                       ])
+    growthrate, addpayment, addpaymentrate, costBalPcnt = np.ix_(*axes.values())
+
+    # investmentgrowth runs while period < termyears * cyclesPerAnnum
+    numperiods = max(int(np.ceil(termyears * cyclesPerAnnum)) - 1, 0)
+    dates, yearidx, _ = cal.periodcalendar(start_date, cyclesPerAnnum, numperiods)
+    axes['Period'] = np.arange(1, numperiods + 1)
+    axes['Month'] = dates
+
+    beg_balance, end_balance, addpay = _investyearblocks(initialvalue, growthrate, addpayment, addpaymentrate,
+                                                         costBalPcnt, yearidx, cyclesPerAnnum)
+    cube = OrderedDict([('Begin Balance', beg_balance),
+                        ('Growth', - beg_balance * growthrate[..., np.newaxis] / cyclesPerAnnum),
+                        ('CostBalance', beg_balance * costBalPcnt[..., np.newaxis] / cyclesPerAnnum),
+                        ('AddPayment', np.broadcast_to(addpay, beg_balance.shape)),
+                        ('End Balance', end_balance),
+                        ('NettGrowth', end_balance - initialvalue),
+                       ])
+
+    if labelled:
+        index = pd.MultiIndex.from_product([axes[key] for key in ['GrowthRate', 'AddPayment', 
+                                            'AddPayRate', 'CostBalPcnt']], 
+                                           names=['GrowthRate', 'AddPayment', 'AddPayRate', 'CostBalPcnt'])
+        columns = pd.Index(axes['Period'], name='Period')
+        cube = OrderedDict((key, pd.DataFrame(val.reshape(-1, numperiods), index=index, columns=columns)) 
+                           for key, val in cube.items())
+    return cube, axes
+
+
 # ============================================================================
 def investment_table(initialvalue, growthrate, termyears, addpayment=0, addpaymentrate=0, costBalPcnt=0,
-                     start_date=(date(2000,1,1)), cyclesPerAnnum=12,ID=''):
+                     start_date=(date(2000,1,1)), cyclesPerAnnum=12,ID='', closedform=True, sensitivity=False):
     """
     Calculate the amortization schedule given the loan details as well as summary stats for the loan
 
@@ -275,24 +1409,36 @@ def investment_table(initialvalue, growthrate, termyears, addpayment=0, addpayme
     :param start_date: Start date for the loan.
     :param cyclesPerAnnum: Number of investment payments in a year.
     :param ID: String ID for this calculation.
+    :param closedform: Calculate the schedule one year at a time with investment_arrays,
+        otherwise period by period with the investmentgrowth generator. Default True.
+    :param sensitivity: Add the derivatives of the End Balance with respect to the growth rate
+        and to costBalPcnt to the schedule and the summary, see investment_sensitivity. Default False.
 
     :return: 
         schedule: investment schedule as a pandas dataframe
         summary: Pandas dataframe that summarizes the investment
     """
     
-    # Generate the schedule 
-    schedule = pd.DataFrame(investmentgrowth(initialvalue=initialvalue, growthrate=growthrate, 
-                                termyears=termyears,addpayment=addpayment, addpaymentrate=addpaymentrate, 
-                                             costBalPcnt=costBalPcnt,start_date=start_date, 
-                                             cyclesPerAnnum=cyclesPerAnnum,ID=ID))
-    
-    # reorder the columns
-    schedule = schedule[['Period','Month','Begin Balance','InitialVal','GrowthRate','Growth',
-                         'costBalPcnt','CostBalance','AddPayment','AddPayRate','End Balance','ID']]
+    if closedform:
+        columns = investment_arrays(initialvalue=initialvalue, growthrate=growthrate, termyears=termyears,
+                                    addpayment=addpayment, addpaymentrate=addpaymentrate,
+                                    costBalPcnt=costBalPcnt, start_date=start_date, 
+                                    cyclesPerAnnum=cyclesPerAnnum)
+        columns['ID'] = [ID] * columns['Period'].shape[0]
+        schedule = pd.DataFrame(columns, copy=False)
+    else:
+        # Generate the schedule 
+        schedule = pd.DataFrame(investmentgrowth(initialvalue=initialvalue, growthrate=growthrate, 
+                                    termyears=termyears,addpayment=addpayment, addpaymentrate=addpaymentrate, 
+                                                 costBalPcnt=costBalPcnt,start_date=start_date, 
+                                                 cyclesPerAnnum=cyclesPerAnnum,ID=ID))
+        
+        # reorder the columns
+        schedule = schedule[['Period','Month','Begin Balance','InitialVal','GrowthRate','Growth',
+                             'costBalPcnt','CostBalance','AddPayment','AddPayRate','End Balance','ID']]
 
-    # Convert to a pandas datetime object to make subsequent calcs easier
-    schedule["Month"] = pd.to_datetime(schedule["Month"])
+        # Use the numpy dates from the shared calendar to make subsequent calcs easier
+        schedule["Month"] = cal.periodcalendar(start_date, cyclesPerAnnum, schedule.shape[0])[0]
     schedule["NettGrowth"] = schedule["End Balance"] - schedule["Begin Balance"][0]
     
     #Create a summary statistics table
@@ -304,5 +1450,99 @@ def investment_table(initialvalue, growthrate, termyears, addpayment=0, addpayme
                        index=['ID','InitialVal','GrowthRate',
                               'Years','AddPayment','AddPayRate',
                               'EndBalance','CostBalPcnt',"NettGrowth"])
+
+    if sensitivity:
+        dgrowth = investment_sensitivity(schedule["Begin Balance"].to_numpy(), growthrate, costBalPcnt, 
+                                         cyclesPerAnnum)
+        schedule["dEndBalance/dGrowthRate"] = dgrowth
+        schedule["dEndBalance/dCostBalPcnt"] = - dgrowth
+        stats["dEndBalance/dGrowthRate"] = dgrowth[-1]
+        stats["dEndBalance/dCostBalPcnt"] = - dgrowth[-1]
     
-    return schedule, stats
\ No newline at end of file
+    return schedule, stats
+
+
+# ============================================================================
+def investment_sensitivity(beg_balance, growthrate, costBalPcnt, cyclesPerAnnum):
+    """Returns the derivative of the End Balance of every period with respect to the growth rate
+
+    Differentiating the investmentgrowth recurrence End = Begin * m + AddPayment, with 
+    m = 1 + (growthrate - costBalPcnt) / cyclesPerAnnum, gives dEnd/dg = dBegin/dg * m + Begin / 
+    cyclesPerAnnum, which is summed here in closed form over the begin balances. The balances 
+    depend on the growth rate and the cost only through their difference, so that the 
+    derivative with respect to costBalPcnt is the negative of this one. See feecurve and 
+    breakevenfee for the End Balance at other fee levels from the same schedule.
+
+    :param beg_balance: Begin Balance of every period, numpy array
+    :param growthrate: The annual growth rate
+    :param costBalPcnt: managment cost as percentage on balance
+    :param cyclesPerAnnum: Number of investment payment cycles in a year.
+
+    :return: 
+        dgrowth: numpy array with dEnd/dgrowthrate for every period
+    """
+    mult = 1 + (growthrate - costBalPcnt) / cyclesPerAnnum
+    steps = np.arange(beg_balance.shape[0])
+    # dEnd_k/dg = sum_{j<=k} m**(k-j) Begin_j / cyclesPerAnnum
+    return mult ** steps * np.cumsum(beg_balance * mult ** -steps.astype(float)) / cyclesPerAnnum
+
+# ============================================================================
+def feecurve(schedule, costBalPcnts, cyclesPerAnnum=12):
+    """Returns the End Balance and its fee derivative for other fee levels, from one investment schedule
+
+    The End Balance is a polynomial in m = 1 + (growthrate - costBalPcnt) / cyclesPerAnnum, 
+    with the initial value and the additional payments of the schedule as coefficients,
+    which do not depend on the fee. The End Balance at every fee level then follows exactly 
+    from the one schedule, without recalculating it.
+
+    :param schedule: investment schedule from investment_table
+    :param costBalPcnts: managment costs as percentage on balance, list or array
+    :param cyclesPerAnnum: Number of investment payment cycles in a year of the schedule.
+
+    :return: 
+        curve: Pandas dataframe with the CostBalPcnt, EndBalance and dEndBalance/dCostBalPcnt 
+            for each fee level
+    """
+    initialvalue = schedule['InitialVal'].iloc[0]
+    growthrate = schedule['GrowthRate'].iloc[0]
+    addpayment = schedule['AddPayment'].to_numpy(dtype=float)
+    numperiods = addpayment.shape[0]
+    costBalPcnt = np.ravel(np.asarray(costBalPcnts, dtype=float))
+
+    mult = 1 + (growthrate - costBalPcnt[:, np.newaxis]) / cyclesPerAnnum
+    powers = numperiods - 1 - np.arange(numperiods)
+    endBalance = initialvalue * mult[:, 0] ** numperiods + (addpayment * mult ** powers).sum(axis=1)
+    dmult = (numperiods * initialvalue * mult[:, 0] ** (numperiods - 1) + 
+             (addpayment * powers * mult ** np.maximum(powers - 1, 0)).sum(axis=1))
+    return pd.DataFrame(OrderedDict([('CostBalPcnt', costBalPcnt),
+                                     ('EndBalance', endBalance),
+                                     ('dEndBalance/dCostBalPcnt', - dmult / cyclesPerAnnum),
+                                    ]))
+
+
+# ============================================================================
+def breakevenfee(schedule, target=None, cyclesPerAnnum=12, tolerance=1e-10, maxiter=100):
+    """Returns the fee level at which the End Balance of an investment schedule equals target
+
+    The fee is found by Newton iteration on feecurve, starting from the fee of the schedule.
+
+    :param schedule: investment schedule from investment_table
+    :param target: End Balance to reach, None for the initial value plus all the additional
+        payments, i.e. the fee at which the investment only returns what was paid in.
+    :param cyclesPerAnnum: Number of investment payment cycles in a year of the schedule.
+    :param tolerance: Accuracy of the fee.
+    :param maxiter: Maximum number of iterations.
+
+    :return: 
+        fee: costBalPcnt at which the End Balance equals target
+    """
+    if target is None:
+        target = schedule['InitialVal'].iloc[0] + schedule['AddPayment'].sum()
+    fee = schedule['costBalPcnt'].iloc[0]
+    for _ in range(maxiter):
+        curve = feecurve(schedule, fee, cyclesPerAnnum).iloc[0]
+        step = (curve['EndBalance'] - target) / curve['dEndBalance/dCostBalPcnt']
+        fee -= step
+        if abs(step) < tolerance:
+            return fee
+    raise ValueError(f'The break-even fee did not converge in {maxiter} iterations')
@@ -0,0 +1,336 @@
+import os
+import sys
+import numpy as np
+
+# Numba is optional: without it, or with NUMBA_DISABLE_JIT set, havejit is False and the 
+# callers use their numpy code
+try:
+    import numba
+    havejit = not numba.config.DISABLE_JIT
+except ImportError:
+    numba = None
+    havejit = False
+
+
+# ============================================================================
+def _jit(func):
+    """Compiles func with numba if available, otherwise returns it unchanged
+    """
+    if not havejit:
+        return func
+    return numba.njit(cache=True, nogil=True)(func)
+
+
+# ============================================================================
+@_jit
+def _round2(x):
+    """Rounds x to cents, with the same result as round(x, 2)
+
+    round(x, 2) rounds the exact value of x, while x * 100 is itself rounded. The product
+    is therefore split into hi + lo without error (Dekker), and a half cent in hi is 
+    resolved by the sign of lo.
+    """
+    hi = x * 100.
+    split = 134217729. * x
+    xh = split - (split - x)
+    lo = (xh * 100. - hi) + (x - xh) * 100.
+    rounded = np.rint(hi)
+    if hi - rounded == 0.5 and lo > 0:
+        rounded += 1.
+    elif hi - rounded == -0.5 and lo < 0:
+        rounded -= 1.
+    return rounded / 100.
+
+
+# ============================================================================
+@_jit
+def amortise_schedule(principal, ratec, reqpayment, addyear, cols, store):
+    """Amortises a single loan into preallocated columns, as a compiled loop over periods
+
+    Gives the same numbers as fingenerators.amortise_arrays, with the interest rounded 
+    as round(x, 2).
+
+    :param principal: Amount borrowed (positive)
+    :param ratec: Interest rate per period
+    :param reqpayment: Required payment (negative)
+    :param addyear: Additional payment (negative) in each period, float array
+    :param cols: (5 x period) array for Begin Balance, ReqPayment, AddPayment, Interest and End Balance
+    :param store: If False, cols is not used and no per-period values are stored.
+
+    :return:
+        numperiods: number of payments, -1 if the loan is not paid off within addyear
+        totinterest: total interest, summed period by period
+    """
+    beg_balance = principal
+    totinterest = 0.
+    for p in range(addyear.shape[0]):
+        interest = - _round2(ratec * beg_balance)
+        owed = beg_balance - interest
+        req = reqpayment
+        add = addyear[p]
+        end_balance = owed + req + add
+        final = end_balance <= 0 or owed < -req or owed + req < -add
+        if final:
+            # the payments are reduced to what is left to pay off
+            req = - min(-reqpayment, owed)
+            add = - min(-addyear[p], owed + req)
+            end_balance = owed + req + add
+        totinterest += interest
+        if store:
+            cols[0, p] = beg_balance
+            cols[1, p] = req
+            cols[2, p] = add
+            cols[3, p] = interest
+            cols[4, p] = end_balance
+        if final:
+            return p + 1, totinterest
+        beg_balance = end_balance
+    return -1, totinterest
+
+
+# ============================================================================
+@_jit
+def _amortise_pass(principal, ratec, reqpayment, addpayment, payrate, newyear, numpay, totinterest, cols, store):
+    """Amortises the loans period by period, filling numpay and totinterest, and cols if store
+
+    The loop over the loans still being paid off is the inner loop, so that the loans
+    are calculated independently of each other from one period to the next.
+    """
+    numloans = principal.shape[0]
+    balance = principal.copy()
+    add = addpayment.copy()
+    active = np.arange(numloans)
+    numactive = 0
+    for i in range(numloans):
+        if balance[i] > 0:
+            active[numactive] = i
+            numactive += 1
+        numpay[i] = 0
+        totinterest[i] = 0.
+    for p in range(newyear.shape[0]):
+        if numactive == 0:
+            break
+        stillactive = 0
+        for k in range(numactive):
+            i = active[k]
+            beg_balance = balance[i]
+            # only increase the additional payment once per year
+            if newyear[p]:
+                add[i] = add[i] * payrate[i]
+            # same as np.round(ratec * beg_balance, 2), which is slow on scalars
+            interest = - np.rint(ratec[i] * beg_balance * 100.) / 100.
+            owed = beg_balance - interest
+            # the payments are reduced to what is left to pay off in the final period
+            req = max(reqpayment[i], -owed)
+            addpay = max(add[i], -(owed + req))
+            end_balance = owed + req + addpay
+            totinterest[i] += interest
+            if store:
+                cols[0, i, p] = beg_balance
+                cols[1, i, p] = req
+                cols[2, i, p] = addpay
+                cols[3, i, p] = interest
+                cols[4, i, p] = end_balance
+            balance[i] = end_balance
+            numpay[i] = p + 1
+            if end_balance > 0:
+                active[stillactive] = i
+                stillactive += 1
+        numactive = stillactive
+    # loans not paid off within newyear
+    for k in range(numactive):
+        numpay[active[k]] = -1
+
+
+# ============================================================================
+@_jit
+def amortise_loans(principal, ratec, reqpayment, addpayment, payrate, newyear, doschedule):
+    """Amortises many loans in floating point, as compiled loops over periods and loans
+
+    Gives the same numbers as the numpy loop in fingenerators.amortisation_batch.
+
+    :param principal: Amounts borrowed (positive), float array
+    :param ratec: Interest rates per period, float array
+    :param reqpayment: Required payments (negative), float array
+    :param addpayment: Additional payments (negative), float array
+    :param payrate: Yearly escalation factors (1 + addpayrate) of the additional payments, float array
+    :param newyear: True for the periods that start a new calendar year, see calendarfuns.periodcalendar
+    :param doschedule: If False, no per-period values are stored.
+
+    :return:
+        numpay: number of payments per loan, -1 for loans not paid off within newyear
+        totinterest: total interest per loan
+        cols: (5 x loan x period) array of Begin Balance, ReqPayment, AddPayment, Interest
+            and End Balance, with zero periods if doschedule is False
+    """
+    numloans = principal.shape[0]
+    numpay = np.zeros(numloans, dtype=np.int64)
+    totinterest = np.zeros(numloans)
+    cols = np.zeros((5, numloans, 0))
+    _amortise_pass(principal, ratec, reqpayment, addpayment, payrate, newyear, numpay, totinterest, cols, False)
+    if doschedule and numloans > 0 and numpay.min() >= 0:
+        # second pass, now that the number of periods is known
+        cols = np.zeros((5, numloans, numpay.max()))
+        _amortise_pass(principal, ratec, reqpayment, addpayment, payrate, newyear, numpay, totinterest, cols, True)
+    return numpay, totinterest, cols
+
+
+# ============================================================================
+@_jit
+def _roundeddivide(numer, denom, halfeven):
+    """Scalar integer division of numer by the positive denom, rounded to the nearest integer
+
+    Gives the same numbers as fingenerators.roundeddivide, with the tie taken from the remainder.
+    """
+    magnitude = abs(numer)
+    shifted = 2 * magnitude + denom
+    quot, rem = divmod(shifted, 2 * denom)
+    if halfeven and rem == 0 and quot & 1 == 1:
+        quot -= 1
+    return -quot if numer < 0 else quot
+
+
+# ============================================================================
+@_jit
+def _amortise_cents_pass(principal, ratenum, ratec, denom, reqpayment, addpayment, paynum, scale, halfeven, 
+                         newyear, numpay, totinterest, cols, store):
+    """Amortises the loans in int64 cents period by period, as _amortise_pass
+    """
+    numloans = principal.shape[0]
+    balance = principal.copy()
+    add = addpayment.copy()
+    active = np.arange(numloans)
+    numactive = 0
+    for i in range(numloans):
+        if balance[i] > 0:
+            active[numactive] = i
+            numactive += 1
+        numpay[i] = 0
+        totinterest[i] = 0
+    for p in range(newyear.shape[0]):
+        if numactive == 0:
+            break
+        stillactive = 0
+        for k in range(numactive):
+            i = active[k]
+            beg_balance = balance[i]
+            # only increase the additional payment once per year
+            if newyear[p]:
+                add[i] = _roundeddivide(add[i] * paynum[i], scale, halfeven)
+            # the int64 division is only needed close to a half cent, where the float 
+            # product can round the wrong way, elsewhere the rounding modes agree
+            estimate = beg_balance * ratec[i]
+            rounded = np.rint(estimate)
+            if abs(abs(estimate - rounded) - 0.5) < 1e-9 * (1. + estimate):
+                interest = - _roundeddivide(beg_balance * ratenum[i], denom, halfeven)
+            else:
+                interest = - np.int64(rounded)
+            owed = beg_balance - interest
+            # the payments are reduced to what is left to pay off in the final period
+            req = max(reqpayment[i], -owed)
+            addpay = max(add[i], -(owed + req))
+            end_balance = owed + req + addpay
+            totinterest[i] += interest
+            if store:
+                cols[0, i, p] = beg_balance
+                cols[1, i, p] = req
+                cols[2, i, p] = addpay
+                cols[3, i, p] = interest
+                cols[4, i, p] = end_balance
+            balance[i] = end_balance
+            numpay[i] = p + 1
+            if end_balance > 0:
+                active[stillactive] = i
+                stillactive += 1
+        numactive = stillactive
+    # loans not paid off within newyear
+    for k in range(numactive):
+        numpay[active[k]] = -1
+
+
+# ============================================================================
+@_jit
+def amortise_cents_loans(principal, ratenum, denom, reqpayment, addpayment, paynum, scale, halfeven, 
+                         newyear, doschedule):
+    """Amortises many loans in int64 cents, as compiled loops over periods and loans
+
+    Gives the same numbers as the numpy loop in fingenerators.amortise_cents.
+
+    :param principal: Amounts borrowed in cents (positive), int64 array
+    :param ratenum: Annual interest rates in fixed point, int64 array, see fingenerators.ratescale
+    :param denom: Fixed point scale of the rates times the number of cycles per year
+    :param reqpayment: Required payments in cents (negative), int64 array
+    :param addpayment: Additional payments in cents (negative), int64 array
+    :param paynum: Yearly escalation factors (1 + addpayrate) of the additional payments in fixed point, int64 array
+    :param scale: Fixed point scale of paynum
+    :param halfeven: True for bankers' rounding, False for half-up
+    :param newyear: True for the periods that start a new calendar year, see calendarfuns.periodcalendar
+    :param doschedule: If False, no per-period values are stored.
+
+    :return:
+        numpay: number of payments per loan, -1 for loans not paid off within newyear
+        totinterest: total interest per loan in cents
+        cols: (5 x loan x period) int64 array of Begin Balance, ReqPayment, AddPayment, Interest
+            and End Balance, with zero periods if doschedule is False
+    """
+    numloans = principal.shape[0]
+    numpay = np.zeros(numloans, dtype=np.int64)
+    totinterest = np.zeros(numloans, dtype=np.int64)
+    cols = np.zeros((5, numloans, 0), dtype=np.int64)
+    ratec = ratenum / denom
+    _amortise_cents_pass(principal, ratenum, ratec, denom, reqpayment, addpayment, paynum, scale, halfeven, 
+                         newyear, numpay, totinterest, cols, False)
+    if doschedule and numloans > 0 and numpay.min() >= 0:
+        # second pass, now that the number of periods is known
+        cols = np.zeros((5, numloans, numpay.max()), dtype=np.int64)
+        _amortise_cents_pass(principal, ratenum, ratec, denom, reqpayment, addpayment, paynum, scale, halfeven, 
+                             newyear, numpay, totinterest, cols, True)
+    return numpay, totinterest, cols
+
+
+# ============================================================================
+@_jit
+def invest_scenarios(initialvalue, growthrate, addpayment, payrate, costBalPcnt, newyear, cyclesPerAnnum,
+                     numperiods, doschedule):
+    """Runs the investmentgrowth recurrence for many scenarios, as compiled loops over periods and scenarios
+
+    Gives the same numbers as fingenerators.investmentgrowth.
+
+    :param initialvalue: Initial values, float array
+    :param growthrate: Annual growth rates, float array
+    :param addpayment: Additional investment amounts per period, float array
+    :param payrate: Yearly escalation factors (1 + addpaymentrate) of the additional investment, float array
+    :param costBalPcnt: Management costs as fraction of the balance, float array
+    :param newyear: True for the periods that start a new calendar year, see calendarfuns.periodcalendar
+    :param cyclesPerAnnum: Number of investment payment cycles in a year.
+    :param numperiods: Number of periods of each scenario, int array, at most len(newyear)
+    :param doschedule: If False, no per-period values are stored.
+
+    :return:
+        endbalance: End Balance of each scenario after its last period (the initial value if no periods)
+        cols: (5 x scenario x period) array of Begin Balance, Growth, CostBalance, AddPayment
+            and End Balance, with zero periods if doschedule is False
+    """
+    numscen = initialvalue.shape[0]
+    endbalance = initialvalue.copy()
+    add = addpayment.copy()
+    cols = np.zeros((5, numscen, newyear.shape[0] if doschedule else 0))
+    for p in range(newyear.shape[0]):
+        for i in range(numscen):
+            if p >= numperiods[i]:
+                continue
+            beg_balance = endbalance[i]
+            # only increase the additional payment once per year
+            if newyear[p]:
+                add[i] = add[i] * payrate[i]
+            growth = - beg_balance * growthrate[i] / cyclesPerAnnum
+            costBal = beg_balance * costBalPcnt[i] / cyclesPerAnnum
+            end_balance = beg_balance - growth + add[i] - costBal
+            if doschedule:
+                cols[0, i, p] = beg_balance
+                cols[1, i, p] = growth
+                cols[2, i, p] = costBal
+                cols[3, i, p] = add[i]
+                cols[4, i, p] = end_balance
+            endbalance[i] = end_balance
+    return endbalance, cols
@@ -0,0 +1,187 @@
+import sys
+import hashlib
+import inspect
+import functools
+import numpy as np
+import pandas as pd
+from datetime import date, datetime
+from collections import OrderedDict
+
+
+sys.path = ["./"]+sys.path
+
+import fingenerators as fingen
+
+
+# with copy-on-write a shallow copy is a read-only view: writing to it copies the data first
+_copyonwrite = int(pd.__version__.split('.')[0]) >= 3 or pd.options.mode.copy_on_write is True
+
+
+# ============================================================================
+def canonicalkey(funcname, params):
+    """Returns a content hash for a function name and its (named) parameter values
+
+    The values are written out exactly (floats by their hex representation) together
+    with their type, so that e.g. the complex addpayment notation 0.02j, a money value
+    -2300 and a start_date all give distinct and repeatable keys. Numpy scalars hash
+    the same as the equivalent python values.
+    """
+    def canon(value):
+        if isinstance(value, np.generic):
+            value = value.item()
+        if isinstance(value, bool) or value is None:
+            return repr(value)
+        if isinstance(value, int):
+            return f'int:{value}'
+        if isinstance(value, float):
+            return f'float:{value.hex()}'
+        if isinstance(value, complex):
+            return f'complex:{value.real.hex()},{value.imag.hex()}'
+        if isinstance(value, str):
+            return f'str:{value!r}'
+        if isinstance(value, (date, datetime, pd.Timestamp)):
+            return f'{type(value).__name__}:{value.isoformat()}'
+        if isinstance(value, np.ndarray):
+            value = np.ascontiguousarray(value)
+            return f'ndarray:{value.dtype.str}:{value.shape}:{hashlib.sha256(value.tobytes()).hexdigest()}'
+        if isinstance(value, (list, tuple)):
+            return f'{type(value).__name__}:[' + ','.join(canon(v) for v in value) + ']'
+        if isinstance(value, dict):
+            return 'dict:{' + ','.join(f'{canon(k)}={canon(value[k])}' for k in sorted(value)) + '}'
+        raise TypeError(f'Cannot make a cache key from {type(value).__name__}')
+
+    text = funcname + '(' + ';'.join(f'{name}={canon(params[name])}' for name in params) + ')'
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+# ============================================================================
+def readonlyview(value):
+    """Returns a view on a cached value that cannot be used to change the cached value
+
+    Pandas objects are returned as shallow copies, which are views under copy-on-write
+    (pandas >= 3, or when enabled) and deep copies otherwise. Numpy arrays are returned
+    as non-writeable views. Tuples, lists and dicts are handled element by element.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=not _copyonwrite)
+    if isinstance(value, np.ndarray):
+        view = value.view()
+        view.flags.writeable = False
+        return view
+    if isinstance(value, tuple):
+        return tuple(readonlyview(v) for v in value)
+    if isinstance(value, list):
+        return [readonlyview(v) for v in value]
+    if isinstance(value, dict):
+        return type(value)((k, readonlyview(v)) for k, v in value.items())
+    return value
+
+
+# ============================================================================
+def sizeofvalue(value):
+    """Returns the approximate memory size in bytes of a (cached) value
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(sizeofvalue(v) for v in value)
+    if isinstance(value, dict):
+        return sum(sizeofvalue(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+# ============================================================================
+class LRUCache:
+    """Least-recently-used cache bounded by the number of entries and by total bytes
+
+    :param maxentries: Maximum number of entries kept in the cache.
+    :param maxbytes: Maximum total size of the entries kept in the cache.
+    """
+
+    def __init__(self, maxentries=1024, maxbytes=256 * 2**20):
+        self.maxentries = maxentries
+        self.maxbytes = maxbytes
+        self.clear()
+
+    def clear(self):
+        """Removes all entries and resets the counters
+        """
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Returns (True, value) if key is in the cache, else (False, None)
+        """
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return True, self.entries[key][0]
+        self.misses += 1
+        return False, None
+
+    def put(self, key, value):
+        """Stores value under key, evicting the least recently used entries if required
+        """
+        size = sizeofvalue(value)
+        if size > self.maxbytes:
+            return
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key)[1]
+        self.entries[key] = (value, size)
+        self.nbytes += size
+        while len(self.entries) > self.maxentries or self.nbytes > self.maxbytes:
+            self.nbytes -= self.entries.popitem(last=False)[1][1]
+            self.evictions += 1
+
+    def info(self):
+        """Returns the cache counters as a pandas series
+        """
+        return pd.Series([self.hits, self.misses, self.evictions, len(self.entries), self.nbytes,
+                          self.maxentries, self.maxbytes],
+                         index=['Hits', 'Misses', 'Evictions', 'Entries', 'Bytes',
+                                'MaxEntries', 'MaxBytes'])
+
+
+# ============================================================================
+def memoize(func, cache=None):
+    """Returns a memoized version of func, keyed on the canonical hash of all its parameters
+
+    Positional and keyword arguments are bound to the signature of func, with the
+    defaults applied, so that equivalent calls share a cache entry. Cached results are
+    returned through readonlyview, so that changing a returned schedule does not
+    change later results. The cache is available as the cache attribute.
+
+    :param func: function to memoize, its results must depend only on its parameters.
+    :param cache: LRUCache to use, a new LRUCache if None.
+    """
+    cache = LRUCache() if cache is None else cache
+    signature = inspect.signature(func)
+    funcname = f'{func.__module__}.{func.__qualname__}'
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = canonicalkey(funcname, bound.arguments)
+        found, value = cache.get(key)
+        if not found:
+            value = func(*args, **kwargs)
+            cache.put(key, value)
+        return readonlyview(value)
+
+    wrapper.cache = cache
+    return wrapper
+
+
+# ============================================================================
+# cached versions of the amortisation and investment engines, sharing one cache
+enginecache = LRUCache(maxentries=1024, maxbytes=256 * 2**20)
+amortisation_table = memoize(fingen.amortisation_table, enginecache)
+investment_table = memoize(fingen.investment_table, enginecache)
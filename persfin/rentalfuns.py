@@ -1,5 +1,6 @@
 import os
 import sys
+import inspect
 import numpy as np
 import pandas as pd
 from datetime import date
@@ -13,21 +14,83 @@ sys.path = ["./"]+sys.path
 
 import utilityfuns as ufun
 import fingenerators as fingen
+import memofuns as memo
+import calendarfuns as cal
+import taxfuns as tax
 
 
 
 
 # ============================================================================
-def rentalProperty(principal,interest_rate,bondyears,calcyears,rentpmonth,rentpermonthInc,agentPcnt,levy,
-                   ratesnt,levyInc,ratesntInc,maintPcnt,
-                   taxrate,riskPcnt=0,cyclesPerAnnum=12,doplot=False,start_date=date(2000, 1,1),
-                   ID=''):
-    
-    reqpayment = round(np.pmt(rate=interest_rate/cyclesPerAnnum, nper=bondyears*cyclesPerAnnum, 
-                              pv=principal, fv=0, when='end'),2)
-   
-    
-    df, stats = fingen.amortisation_table(
+def bondschedule(df, stats, numperiods, start_date=date(2000, 1,1), ID=''):
+    """Returns the bond schedule columns, extended with zero-content lines up to numperiods
+
+    The columns are preallocated for the whole horizon, and the lines after the loan is 
+    paid off are filled by one slice assignment per column. The added lines have no 
+    payments, balance or interest, and are one month apart starting on the payoff date.
+
+    :param df: amortisation_table schedule, or None if there were no payments
+    :param stats: amortisation_table stats
+    :param numperiods: Number of lines required
+    :param start_date: Start date, used for the added lines if there were no payments
+    :param ID: String ID for the added lines
+
+    :return: OrderedDict of numpy arrays, with at least numperiods lines
+    """
+    numpay = 0 if df is None else df.shape[0]
+    numlines = max(int(numperiods), numpay)
+    columns = OrderedDict()
+    columns['Period'] = np.arange(1, numlines + 1)
+    columns['Month'] = np.empty(numlines, dtype='datetime64[D]')
+    for colname in ['Begin Balance', 'ReqPayment', 'AddPayment', 'Interest', 'End Balance']:
+        columns[colname] = np.zeros(numlines)
+        if numpay > 0:
+            columns[colname][:numpay] = df[colname].to_numpy()
+    columns['Principal'] = np.full(numlines, float(stats['Principal']))
+    columns['InterestRate'] = np.empty(numlines)
+    columns['ID'] = np.full(numlines, ID, dtype=object)
+    if numpay > 0:
+        columns['Month'][:numpay] = df['Month'].to_numpy()
+        columns['InterestRate'][:numpay] = df['InterestRate'].to_numpy()
+        columns['ID'][:numpay] = df['ID'].to_numpy()
+        curdate = stats['Payoff Date']
+        interest_rate = df['InterestRate'].mean()
+    else:
+        curdate = start_date
+        interest_rate = stats['Interest Rate']
+    columns['Month'][numpay:] = cal.periodcalendar(curdate, 12, numlines - numpay)[0]
+    columns['InterestRate'][numpay:] = interest_rate
+    return columns
+
+
+# ============================================================================
+_rentalstatsindex = pd.Index(["Bond","Interest Rate","BondYears",
+                              "ReqPaymentMonth","TotalInterest",
+                              "CumCashFlow","Num Payments",
+                              "CalcYears",
+                              "InitRent",  "RentIncrease",
+                              "InitLevy",  "LevyIncrease",
+                              "InitRandT",  "RandTIncrease",
+                              "TaxRate","AgentPcnt",
+                              "Maint","MaintPcnt",
+                              "Risk","RiskPcnt",
+                              "Total Rent",
+                              "Tax",
+                              "Income",
+                              "RentAfterCostsB4TaxFrac",
+                              "ID",
+                             ])
+
+
+# ============================================================================
+def rentalbond(principal, interest_rate, bondyears, numperiods, cyclesPerAnnum=12, start_date=date(2000, 1,1), ID=''):
+    """Returns the bond schedule columns for a rental property, see bondschedule, and the bond stats
+
+    The required payment pays off the bond over bondyears, rounded to cents.
+    """
+    reqpayment = float(fingen.annuitypayment(principal, interest_rate/cyclesPerAnnum, bondyears*cyclesPerAnnum, decimals=2))
+
+    df, stats = memo.amortisation_table(
         principal=principal, 
         interest_rate=interest_rate, 
         bondyears=bondyears, 
@@ -36,112 +99,158 @@ def rentalProperty(principal,interest_rate,bondyears,calcyears,rentpmonth,rentpe
         start_date=start_date,
         ID=ID,
         )
-    numcycles = stats['Num Payments']
-    
+
     # if loan is paid off before end of the term add zero-content lines
-    if numcycles < calcyears * cyclesPerAnnum + 1:
-        if numcycles == 0:
-            df = pd.DataFrame()
-            curdate = start_date
-        else:
-            curdate = stats['Payoff Date']
-        while numcycles < calcyears * cyclesPerAnnum + 1:
-            # add additional lines with zero interest costs 
-            dic =  OrderedDict([('Month',curdate),
-                           ('Period', numcycles+1),
-                           ('Begin Balance', 0),
-                           ('ReqPayment', 0),
-                           ('Principal', stats['Principal']),
-                           ('InterestRate', df['InterestRate'].mean()),
-                           ('Interest', 0),
-                           ('AddPayment', 0),
-                           ('End Balance', 0),
-                           ('ID',ID),
-                               ],)
-            df = df.append(pd.DataFrame(dic, index=[numcycles]),sort=True)
-            curdate += relativedelta(months=1)
-            numcycles += 1
-
-    # rent income
-    rischedule = fingen.annIncreaseTable(value=rentpmonth, increasepyear=rentpermonthInc, numcycles=numcycles)
-    # costs
-    levyschedule = fingen.annIncreaseTable(value=levy, increasepyear=levyInc, numcycles=numcycles,colhead='Levy')
-    ratesntschedule = fingen.annIncreaseTable(value=ratesnt, increasepyear=ratesntInc, numcycles=numcycles,colhead='RatesT')
-
-
-    # Now merge the bond table with the rent income table
-    dfc = df.copy().drop(["AddPayment"],axis=1)
-    dfc = dfc.merge(rischedule.drop(["Month"],axis=1), on='Period')
-    dfc = dfc.merge(levyschedule.drop(["Month"],axis=1), on='Period')
-    dfc = dfc.merge(ratesntschedule.drop(["Month"],axis=1), on='Period')
-
-    #agent fees
-    dfc['Agent'] = -agentPcnt * dfc['Rent']
-    
-    #maintenance
-    dfc['Maint'] = -maintPcnt * dfc['Rent']
+    return bondschedule(df, stats, numperiods, start_date, ID), stats
 
-    #risk
-    dfc['Risk'] = -riskPcnt * dfc['Rent']
-    
-    # number of payments
-    dfc['NumPay'] = stats['Num Payments']
 
-    # save tax for later
-    dfc['TaxRate'] = taxrate
-    
-    #costs
-    dfc['Costs'] = dfc['Interest']+ dfc['Agent']+ dfc['Levy']+ dfc['RatesT'] + dfc['Maint'] + dfc['Risk']
-    
+# ============================================================================
+def rentalcashflows(interest, reqpayment, rent, levy, ratesnt, agentPcnt, maintPcnt, riskPcnt, taxrate, taxfn=None):
+    """Returns the derived rental property cash flows for Period-aligned arrays
+
+    The inputs are broadcast against each other, with the periods on the last axis, and
+    each derived column is allocated once and then updated in place.
+
+    :param interest: bond interest per period (negative)
+    :param reqpayment: bond payment per period (negative)
+    :param rent: rent income per period
+    :param levy: levy per period (negative)
+    :param ratesnt: rates and taxes per period (negative)
+    :param agentPcnt: agent fees as fraction of the rent
+    :param maintPcnt: maintenance as fraction of the rent
+    :param riskPcnt: risk provision as fraction of the rent
+    :param taxrate: tax rate on the rent after costs
+    :param taxfn: function returning the (negative) tax on the RentAfterCosts array, used 
+        instead of taxrate, see taxfuns.monthlytax
+
+    :return: OrderedDict of Agent, Maint, Risk, Costs, RentAfterCosts, Tax, Costs+Tax,
+        Income, CashFlow and RentAfterCostsFrac arrays
+    """
+    cashflows = OrderedDict()
+    cashflows['Agent'] = np.multiply(-agentPcnt, rent)
+    cashflows['Maint'] = np.multiply(-maintPcnt, rent)
+    cashflows['Risk'] = np.multiply(-riskPcnt, rent)
+
+    costs = np.empty(np.broadcast_shapes(np.shape(interest), np.shape(levy), np.shape(ratesnt),
+                                         np.shape(cashflows['Maint']), np.shape(cashflows['Risk'])))
+    np.add(interest, cashflows['Agent'], out=costs)
+    costs += levy
+    costs += ratesnt
+    costs += cashflows['Maint']
+    costs += cashflows['Risk']
+    cashflows['Costs'] = costs
+
     # rent after cost before tax
-    dfc['RentAfterCosts'] = dfc['Rent'] +   dfc['Costs']
-    
+    cashflows['RentAfterCosts'] = np.add(rent, costs)
+
     # tax and net income if bond present; can't get tax back on losses
-    dfc['TaxRate'] =  taxrate 
-    dfc['Tax'] = - taxrate * (dfc['RentAfterCosts'] )
-    dfc['Tax'][dfc['Tax'] > 0] = 0
-    
-    dfc['Costs+Tax'] = dfc['Tax'] + dfc['Costs']
-    dfc['Income'] = dfc['Rent'] + dfc['Costs+Tax'] 
-    dfc['CashFlow'] = dfc['ReqPayment'] + dfc['Income']
+    if taxfn is None:
+        tax = np.multiply(-taxrate, cashflows['RentAfterCosts'])
+        np.minimum(tax, 0, out=tax)
+    else:
+        tax = np.broadcast_to(taxfn(cashflows['RentAfterCosts']), costs.shape).copy()
+    cashflows['Tax'] = tax
+
+    cashflows['Costs+Tax'] = np.add(tax, costs)
+    cashflows['Income'] = np.add(rent, cashflows['Costs+Tax'])
+    cashflows['CashFlow'] = np.add(reqpayment, cashflows['Income'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cashflows['RentAfterCostsFrac'] = np.divide(cashflows['RentAfterCosts'], rent)
+    return cashflows
+
+
+# ============================================================================
+def rentalflows(principal,interest_rate,bondyears,calcyears,rentpmonth,rentpermonthInc,agentPcnt,levy,
+                ratesnt,levyInc,ratesntInc,maintPcnt,
+                taxrate,riskPcnt=0,cyclesPerAnnum=12,start_date=date(2000, 1,1),
+                ID='',taxtable=None,otherincome=0):
+    """Returns the Period-aligned arrays and the summary of a rental property, see rentalProperty
+
+    :return:
+        columns: Ordered Dictionary of the bond schedule arrays, see bondschedule
+        flows: Ordered Dictionary of the Rent, Levy, RatesT and rentalcashflows arrays
+        stats: amortisation_table stats of the bond
+        istats: summary statistics of rentalProperty
+    """
+    columns, stats = rentalbond(principal, interest_rate, bondyears, calcyears * cyclesPerAnnum + 1,
+                                cyclesPerAnnum, start_date, ID)
+    numcycles = columns['Period'].shape[0]
+
+    # rent income and costs, aligned with the bond schedule on Period
+    _, (rent, levies, ratests) = fingen.escalation_arrays([rentpmonth, levy, ratesnt],
+                                                          [rentpermonthInc, levyInc, ratesntInc], numcycles)
+    flows = OrderedDict([('Rent', rent), ('Levy', levies), ('RatesT', ratests)])
+    taxfn = None
+    if taxtable is not None:
+        # the rent after costs is taxed per tax year, on top of the other income
+        dates = cal.periodcalendar(start_date, 12, numcycles)[0]
+        taxfn = lambda rentaftercosts: tax.monthlytax(rentaftercosts, dates, taxtable, otherincome)
+    flows.update(rentalcashflows(columns['Interest'], columns['ReqPayment'], rent, levies, ratests,
+                                 agentPcnt, maintPcnt, riskPcnt, taxrate, taxfn))
+
+    # all the totals in one pass over the periods
+    totals = np.stack([flows['CashFlow'], flows['Maint'], flows['Risk'], rent, 
+                       flows['Tax'], flows['Income'], flows['RentAfterCosts']]).sum(axis=-1)
+    cashflowsum, maintsum, risksum, rentsum, taxsum, incomesum, rentaftercostssum = totals
+    if taxtable is not None:
+        # the effective tax rate on the rent after costs
+        taxrate = - taxsum / rentaftercostssum
 
-    dfc['RentAfterCostsFrac'] = dfc['RentAfterCosts'] / dfc['Rent']
-   
-    
     #Create a summary statistics table
     istats = pd.Series([stats['Principal'],stats['Interest Rate'],stats['BondYears'],
                         stats['ReqPayment'],stats['Total Interest'],
-                        dfc['CashFlow'].sum(),dfc["Period"].count(),
+                        cashflowsum,numcycles,
                         calcyears,
                          rentpmonth,  rentpermonthInc,
                          levy,  levyInc,
                          ratesnt,  ratesntInc,
                          taxrate,agentPcnt,
-                         dfc['Maint'].sum(),maintPcnt,
-                         dfc['Risk'].sum(),riskPcnt,
-                         dfc["Rent"].sum(),
-                         dfc["Tax"].sum(),
-                         dfc["Income"].sum(),
-                         dfc['RentAfterCosts'].sum() / dfc['Rent'].sum(),
+                         maintsum,maintPcnt,
+                         risksum,riskPcnt,
+                         rentsum,
+                         taxsum,
+                         incomesum,
+                         rentaftercostssum / rentsum,
                          ID,
                         ],
-                       index=["Bond","Interest Rate","BondYears",
-                              "ReqPaymentMonth","TotalInterest",
-                              "CumCashFlow","Num Payments",
-                              "CalcYears",
-                              "InitRent",  "RentIncrease",
-                              "InitLevy",  "LevyIncrease",
-                              "InitRandT",  "RandTIncrease",
-                              "TaxRate","AgentPcnt",
-                              "Maint","MaintPcnt",
-                              "Risk","RiskPcnt",
-                              "Total Rent",
-                              "Tax",
-                              "Income",
-                              "RentAfterCostsB4TaxFrac",
-                              "ID",
-                             ])
+                       index=_rentalstatsindex)
 
+    return columns, flows, stats, istats
+
+
+# ============================================================================
+def rentalProperty(principal,interest_rate,bondyears,calcyears,rentpmonth,rentpermonthInc,agentPcnt,levy,
+                   ratesnt,levyInc,ratesntInc,maintPcnt,
+                   taxrate,riskPcnt=0,cyclesPerAnnum=12,doplot=False,start_date=date(2000, 1,1),
+                   ID='',summary_only=False,taxtable=None,otherincome=0):
+    """Calculate a monthly schedule and summary of the cash flows of a rental property with a bond
+
+    With summary_only the summary istats are calculated from the cash flow arrays 
+    without building the schedule dataframe, and None is returned for dfc.
+
+    With a progressive taxtable (see taxfuns.taxtable) the rent after costs is taxed per 
+    tax year on top of the annual otherincome, as in taxfuns.monthlytax, instead of at the 
+    flat taxrate. The TaxRate is then the effective tax rate on the rent after costs.
+    """
+    columns, flows, stats, istats = rentalflows(principal,interest_rate,bondyears,calcyears,rentpmonth,
+                                                rentpermonthInc,agentPcnt,levy,ratesnt,levyInc,ratesntInc,
+                                                maintPcnt,taxrate,riskPcnt,cyclesPerAnnum,start_date,ID,
+                                                taxtable,otherincome)
+    numcycles = columns['Period'].shape[0]
+
+    if summary_only:
+        return None,istats
+
+    del columns['AddPayment']
+    for colname in ['Rent', 'Levy', 'RatesT', 'Agent', 'Maint', 'Risk']:
+        columns[colname] = flows[colname]
+    # number of payments
+    columns['NumPay'] = np.full(numcycles, stats['Num Payments'])
+    # save tax for later
+    columns['TaxRate'] = np.full(numcycles, float(istats['TaxRate']))
+    for colname in ['Costs', 'RentAfterCosts', 'Tax', 'Costs+Tax', 'Income', 'CashFlow', 'RentAfterCostsFrac']:
+        columns[colname] = flows[colname]
+    dfc = pd.DataFrame(columns)
 
     if doplot:
         plotrentalpropcashflowtimeline(dfc)        
@@ -153,6 +262,189 @@ def rentalProperty(principal,interest_rate,bondyears,calcyears,rentpmonth,rentpe
     return dfc,istats
 
 
+# ============================================================================
+def rentalProperty_batch(principal,interest_rate,bondyears,calcyears,rentpmonth,rentpermonthInc,agentPcnt,levy,
+                         ratesnt,levyInc,ratesntInc,maintPcnt,
+                         taxrate,riskPcnt=0,cyclesPerAnnum=12,start_date=date(2000, 1,1),
+                         ID='',docube=False):
+    """
+    Calculate rentalProperty for every combination of bondyears, taxrate and riskPcnt
+
+    The bond is calculated once for each distinct bondyears, and the rent, levy and rates
+    and taxes once for all, after which the cash flows of all the combinations are 
+    calculated together in rentalcashflows, as (bondyears x taxrate x riskPcnt x period)
+    arrays. The summary stats are the same as the istats of rentalProperty.
+
+    :param bondyears: Number of years of the bond, array or scalar
+    :param taxrate: tax rate on the rent after costs, array or scalar
+    :param riskPcnt: risk provision as fraction of the rent, array or scalar
+    :param docube: Also return the monthly cash flows of all combinations. Default False.
+
+    The other parameters are the same as for rentalProperty, and common to all combinations.
+
+    :return:
+        cube: Ordered Dictionary of 'Interest', 'ReqPayment', 'Rent', 'Levy', 'RatesT' and the 
+            rentalcashflows columns, each as (bondyears x taxrate x riskPcnt x period) numpy 
+            array, with NaN after the last period of a bond. None if docube is False.
+        axes: Ordered Dictionary of the values along each axis: 'BondYears', 'TaxRate',
+            'RiskPcnt', 'Period' and 'Month'.
+        summary: Pandas dataframe with the rentalProperty istats of each combination as a row,
+            in the order of the cube, i.e. with riskPcnt changing fastest.
+    """
+    axes = OrderedDict([('BondYears', np.ravel(bondyears)),
+                        ('TaxRate', np.ravel(np.asarray(taxrate, dtype=float))),
+                        ('RiskPcnt', np.ravel(np.asarray(riskPcnt, dtype=float)))])
+    shape = tuple(val.shape[0] for val in axes.values())
+
+    # the bond depends only on bondyears
+    uniqueyears, inverse = np.unique(axes['BondYears'], return_inverse=True)
+    bonds = [rentalbond(principal, interest_rate, years.item(), calcyears * cyclesPerAnnum + 1,
+                        cyclesPerAnnum, start_date, ID) for years in uniqueyears]
+    lengths = np.array([columns['Period'].shape[0] for columns, _ in bonds])
+    numcycles = lengths.max()
+    interest = np.zeros((uniqueyears.shape[0], 1, 1, numcycles))
+    reqpayment = np.zeros((uniqueyears.shape[0], 1, 1, numcycles))
+    for u, (columns, _) in enumerate(bonds):
+        interest[u, 0, 0, :lengths[u]] = columns['Interest']
+        reqpayment[u, 0, 0, :lengths[u]] = columns['ReqPayment']
+
+    # rent income and costs depend on none of the swept parameters
+    dates, (rent, levies, ratests) = fingen.escalation_arrays([rentpmonth, levy, ratesnt],
+                                                              [rentpermonthInc, levyInc, ratesntInc], numcycles)
+    cashflows = rentalcashflows(interest, reqpayment, rent, levies, ratests, agentPcnt, maintPcnt,
+                                axes['RiskPcnt'][:, np.newaxis], axes['TaxRate'][:, np.newaxis, np.newaxis])
+    fullshape = (uniqueyears.shape[0],) + shape[1:] + (numcycles,)
+
+    # totals over the periods of each bond
+    totals = OrderedDict()
+    for colname, values in [('CashFlow', cashflows['CashFlow']), ('Maint', cashflows['Maint']), 
+                            ('Risk', cashflows['Risk']), ('Rent', rent), ('Tax', cashflows['Tax']), 
+                            ('Income', cashflows['Income']), ('RentAfterCosts', cashflows['RentAfterCosts'])]:
+        values = np.broadcast_to(values, fullshape)
+        totals[colname] = np.stack([values[u, ..., :lengths[u]].sum(axis=-1) 
+                                    for u in range(uniqueyears.shape[0])])[inverse].ravel()
+
+    def perbond(key):
+        return np.broadcast_to(np.array([stats[key] for _, stats in bonds])[inverse][:, np.newaxis, np.newaxis], 
+                               shape).ravel()
+    def percombination(values):
+        return np.broadcast_to(values, shape).ravel()
+
+    summary = pd.DataFrame(OrderedDict(zip(_rentalstatsindex, [
+                        perbond('Principal'), perbond('Interest Rate'), perbond('BondYears'),
+                        perbond('ReqPayment'), perbond('Total Interest'),
+                        totals['CashFlow'], percombination(lengths[inverse][:, np.newaxis, np.newaxis]),
+                        calcyears,
+                        rentpmonth,  rentpermonthInc,
+                        levy,  levyInc,
+                        ratesnt,  ratesntInc,
+                        percombination(axes['TaxRate'][:, np.newaxis]), agentPcnt,
+                        totals['Maint'], maintPcnt,
+                        totals['Risk'], percombination(axes['RiskPcnt']),
+                        totals['Rent'],
+                        totals['Tax'],
+                        totals['Income'],
+                        totals['RentAfterCosts'] / totals['Rent'],
+                        ID,
+                        ])))
+
+    axes['Period'] = np.arange(1, numcycles + 1)
+    axes['Month'] = dates
+    cube = None
+    if docube:
+        cube = OrderedDict([('Interest', interest), ('ReqPayment', reqpayment), ('Rent', rent), 
+                            ('Levy', levies), ('RatesT', ratests)])
+        cube.update(cashflows)
+        # no values after the last period of a bond
+        after = (np.arange(numcycles) >= lengths[inverse][:, np.newaxis])[:, np.newaxis, np.newaxis, :]
+        for colname in cube:
+            cube[colname] = np.where(after, np.nan, np.broadcast_to(cube[colname], fullshape)[inverse])
+    return cube, axes, summary
+
+
+# ============================================================================
+# the monthly values added up over the properties in rentalPortfolio
+_portfoliocolumns = ['ReqPayment', 'Interest', 'Rent', 'Levy', 'RatesT', 'Agent', 'Maint', 'Risk', 
+                     'Costs', 'RentAfterCosts', 'Tax', 'Costs+Tax', 'Income', 'CashFlow']
+
+
+# ============================================================================
+def rentalPortfolio(properties, **common):
+    """
+    Calculate the cash flows of a portfolio of rental properties on a shared monthly calendar
+
+    Each property is calculated as in rentalProperty and its monthly values are placed 
+    on the portfolio calendar, which runs from the month of the earliest start_date to 
+    the last month of the latest property. Period p of a property falls in the p-1'th 
+    month after the month of its start_date. The properties can have different start 
+    dates and horizons, and contribute zero outside of their own periods.
+
+    For example, with the property parameters common to all properties given once:
+
+        portfolio, cube, summary = rentalPortfolio(
+            {'PropertyK':{'principal':950000, 'interest_rate':0.0915, 'rentpmonth':11395},
+             'PropertyB':{'principal':610000, 'interest_rate':0.097, 'rentpmonth':6500,
+                          'start_date':date(2001,7,1)}},
+            bondyears=4, calcyears=4, rentpermonthInc=0.06, agentPcnt=0.09, levy=-600, ratesnt=-650,
+            levyInc=0.06, ratesntInc=0.06, maintPcnt=0.03, riskPcnt=0.02, taxrate=0.33)
+
+    :param properties: Ordered Dictionary of the rentalProperty parameters of each property, 
+        keyed on the property ID.
+    :param common: rentalProperty parameters shared by the properties, used where a property 
+        does not give its own value.
+
+    The rentalProperty parameters doplot and summary_only do not apply to a portfolio and are 
+    ignored, other parameters that rentalProperty does not take raise a ValueError.
+
+    :return:
+        portfolio: Pandas dataframe with the Month and the portfolio totals of each month
+        cube: Ordered Dictionary of the (property x month) numpy arrays of the monthly values
+            of each property, with 'ID' and 'Month' giving the two axes.
+        summary: Pandas dataframe with the rentalProperty istats of each property as a row
+    """
+    IDs = list(properties.keys())
+    results = []
+    for ID in IDs:
+        params = dict(common)
+        params.update(properties[ID])
+        params['ID'] = ID
+        params.setdefault('start_date', date(2000, 1,1))
+        for key in ['doplot', 'summary_only']:
+            params.pop(key, None)
+        unknown = sorted(set(params) - set(inspect.signature(rentalflows).parameters))
+        if unknown:
+            raise ValueError(f'Property {ID}: unknown rentalProperty parameters {unknown}')
+        if params.get('cyclesPerAnnum', 12) != 12:
+            raise ValueError(f'Property {ID}: rentalPortfolio requires monthly cycles (cyclesPerAnnum=12)')
+        columns, flows, _, istats = rentalflows(**params)
+        flows.update((colname, columns[colname]) for colname in ['ReqPayment', 'Interest'])
+        results.append((np.datetime64(params['start_date'], 'M'), flows, istats))
+
+    # months between each property's first period and the start of the portfolio
+    firstmonth = min(start for start, _, _ in results) if results else np.datetime64('2000-01', 'M')
+    offsets = [(start - firstmonth).astype(np.int64) for start, _, _ in results]
+    numperiods = max([offset + flows['Rent'].shape[0] for offset, (_, flows, _) in zip(offsets, results)], default=0)
+
+    cube = OrderedDict((colname, np.zeros((len(IDs), numperiods))) for colname in _portfoliocolumns)
+    for k, (offset, (_, flows, _)) in enumerate(zip(offsets, results)):
+        numcycles = flows['Rent'].shape[0]
+        for colname in _portfoliocolumns:
+            cube[colname][k, offset:offset + numcycles] = flows[colname]
+    months = (firstmonth + np.arange(numperiods)).astype('datetime64[D]')
+
+    portfolio = OrderedDict([('Month', months)])
+    portfolio['Properties'] = np.zeros(numperiods, dtype=np.int64)
+    for offset, (_, flows, _) in zip(offsets, results):
+        portfolio['Properties'][offset:offset + flows['Rent'].shape[0]] += 1
+    for colname in _portfoliocolumns:
+        portfolio[colname] = cube[colname].sum(axis=0)
+    cube['ID'] = np.array(IDs, dtype=object)
+    cube['Month'] = months
+
+    summary = pd.DataFrame([istats for _, _, istats in results], columns=_rentalstatsindex)
+    return pd.DataFrame(portfolio), cube, summary
+
+
 # ============================================================================
 def plotrentalpropcashflowtimeline(dfc):
     import matplotlib.pyplot as plt
@@ -0,0 +1,153 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+from datetime import date
+from collections import OrderedDict
+
+
+sys.path = ["./"]+sys.path
+
+import fingenerators as fingen
+
+
+# ============================================================================
+def required_addpayment(target, initialvalue, growthrate, termyears, addpaymentrate=0, costBalPcnt=0,
+                        start_date=(date(2000,1,1)), cyclesPerAnnum=12, doschedule=False):
+    """
+    Solve for the additional investment per period that grows an investment to target
+
+    The End Balance of the investmentgrowth recurrence is linear in the additional payment,
+    also when the payment escalates, so that the solution follows exactly from two batched
+    evaluations: the End Balance without additional payments, and the End Balance of an
+    additional payment of one. Without escalation the latter is the annuity factor
+    ((1+i)**n - 1) / i at the nett rate i = (growthrate - costBalPcnt) / cyclesPerAnnum.
+
+    The parameters are broadcast against each other, so that many targets and scenarios
+    are solved at once.
+
+    :param target: End Balance to reach, array or scalar
+    :param initialvalue: Initial values paid into the investments, array or scalar
+    :param growthrate: The annual growth rates, array or scalar
+    :param termyears: Number of years for the investments, array or scalar
+    :param addpaymentrate: growth in the additional investments compounded annually, array or scalar
+    :param costBalPcnt: managment costs as percentage on balance, array or scalar
+    :param start_date: Start date, common to all scenarios.
+    :param cyclesPerAnnum: Number of investment payments in a year, common to all scenarios.
+    :param doschedule: Also return the schedules at the solutions. Default False.
+
+    :return:
+        solution: Pandas dataframe with one row of investment_batch stats per scenario, with
+            the required AddPayment and the Target
+        schedule: the investment_batch schedules at the solutions, or None if doschedule is False
+    """
+    target, initialvalue, growthrate, termyears, addpaymentrate, costBalPcnt = \
+        [np.ravel(v) for v in np.broadcast_arrays(target, initialvalue, growthrate, termyears,
+                                                  addpaymentrate, costBalPcnt)]
+    target = target.astype(float)
+
+    common = dict(growthrate=growthrate, termyears=termyears, addpaymentrate=addpaymentrate,
+                  costBalPcnt=costBalPcnt, start_date=start_date, cyclesPerAnnum=cyclesPerAnnum,
+                  doschedule=False)
+    _, base = fingen.investment_batch(initialvalue, addpayment=0, **common)
+    _, unit = fingen.investment_batch(0, addpayment=1, **common)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        addpayment = (target - base['EndBalance'].to_numpy()) / unit['EndBalance'].to_numpy()
+
+    common['doschedule'] = doschedule
+    schedule, solution = fingen.investment_batch(initialvalue, addpayment=addpayment, **common)
+    solution['Target'] = target
+    return solution, schedule
+
+
+# ============================================================================
+def _payoffperiods(principal, interest_rate, bondyears, reqpayment, addpayment, addpayrate,
+                   cyclesPerAnnum, start_date, maxyears):
+    """Returns the number of payments of each loan, from amortisation_batch without schedules
+    """
+    _, stats = fingen.amortisation_batch(principal, interest_rate, bondyears, reqpayment, addpayment,
+                                         addpayrate, cyclesPerAnnum=cyclesPerAnnum, start_date=start_date,
+                                         doschedule=False, maxyears=maxyears)
+    return stats['Num Payments'].to_numpy()
+
+
+# ============================================================================
+def required_extrapayment(payoffyears, principal, interest_rate, bondyears, reqpayment=None, addpayrate=0,
+                          cyclesPerAnnum=12, start_date=(date(2000,1,1)), doschedule=False, maxyears=200):
+    """
+    Solve for the smallest additional bond payment that pays off a loan within payoffyears
+
+    The additional payment is solved to the cent, as the smallest payment for which the
+    loan is paid off within payoffyears * cyclesPerAnnum payments. Without escalation the
+    annuity formula gives the total payment directly, which is checked against the
+    amortisation with the interest rounded to cents. Where the check fails, or the
+    additional payment escalates, the payment is found by bisection on whole cents, with
+    every step evaluating all the loans together in amortisation_batch.
+
+    The parameters are broadcast against each other, so that many targets and loans
+    are solved at once.
+
+    :param payoffyears: Number of years in which to pay off the loan, array or scalar
+    :param principal: Amount borrowed (positive), array or scalar
+    :param interest_rate: The *annual* interest rate (positive), array or scalar
+    :param bondyears: Number of years of the loan term (positive), array or scalar
+    :param reqpayment: minimum required payment (negative), array or scalar, None for the
+        payment over bondyears, rounded to cents
+    :param addpayrate: Rate of increase in additional payment, calculated once per year.
+    :param cyclesPerAnnum: Number of payment cycles in a year, common to all loans.
+    :param start_date: Start date, common to all loans.
+    :param doschedule: Also return the schedules at the solutions. Default False.
+    :param maxyears: Give up if a loan is not paid off within this many years.
+
+    :return:
+        solution: Pandas dataframe with one row of amortisation_batch stats per loan, with
+            the required (negative) AddPayment and the PayoffYears target
+        schedule: the amortisation_batch schedules at the solutions, or None if doschedule is False
+    """
+    payoffyears, principal, interest_rate, bondyears, addpayrate = \
+        [np.ravel(v).astype(float) for v in np.broadcast_arrays(payoffyears, principal, interest_rate,
+                                                                bondyears, addpayrate)]
+    ratec = interest_rate / cyclesPerAnnum
+    if reqpayment is None:
+        reqpayment = fingen.annuitypayment(principal, ratec, np.round(bondyears * cyclesPerAnnum), decimals=2)
+    reqpayment = np.broadcast_to(np.ravel(reqpayment), principal.shape).astype(float)
+    numperiods = np.round(payoffyears * cyclesPerAnnum).astype(np.int64)
+    args = (principal, interest_rate, bondyears, reqpayment)
+    rest = (addpayrate, cyclesPerAnnum, start_date, maxyears)
+
+    # bracket in cents: no additional payment, and paying off everything in the first period
+    low = np.zeros(principal.shape, dtype=np.int64)
+    high = np.ceil(principal * (1 + ratec) * 100).astype(np.int64)
+    unsolved = _payoffperiods(*args, 0., *rest) > numperiods
+
+    # without escalation, the total payment from the annuity formula is the first guess
+    guess = np.round(-100 * (fingen.annuitypayment(principal, ratec, numperiods) - reqpayment)).astype(np.int64)
+    guess = np.clip(guess, 1, high)
+    check = unsolved & (addpayrate == 0)
+    if check.any():
+        idx = np.nonzero(check)[0]
+        paidoff = _payoffperiods(*[v[idx] for v in args], -guess[idx] / 100, *[r[idx] if np.ndim(r) else r
+                                 for r in rest]) <= numperiods[idx]
+        notbefore = _payoffperiods(*[v[idx] for v in args], -(guess[idx] - 1) / 100, *[r[idx] if np.ndim(r) else r
+                                   for r in rest]) > numperiods[idx]
+        high[idx[paidoff]] = guess[idx[paidoff]]
+        low[idx[paidoff & notbefore]] = guess[idx[paidoff & notbefore]] - 1
+        low[idx[~paidoff]] = guess[idx[~paidoff]]
+
+    # bisection on whole cents, for all the unsolved loans together
+    while True:
+        idx = np.nonzero(unsolved & (high - low > 1))[0]
+        if idx.shape[0] == 0:
+            break
+        mid = (low[idx] + high[idx]) // 2
+        paidoff = _payoffperiods(*[v[idx] for v in args], -mid / 100, *[r[idx] if np.ndim(r) else r
+                                 for r in rest]) <= numperiods[idx]
+        high[idx] = np.where(paidoff, mid, high[idx])
+        low[idx] = np.where(paidoff, low[idx], mid)
+
+    addpayment = np.where(unsolved, -high / 100, 0.)
+    schedule, solution = fingen.amortisation_batch(*args, addpayment, addpayrate, cyclesPerAnnum=cyclesPerAnnum,
+                                                   start_date=start_date, doschedule=doschedule,
+                                                   maxyears=maxyears)
+    solution['PayoffYears'] = payoffyears
+    return solution, schedule
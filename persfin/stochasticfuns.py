@@ -0,0 +1,550 @@
+import os
+import sys
+import json
+import numpy as np
+import pandas as pd
+from datetime import date
+from collections import OrderedDict
+
+
+sys.path = ["./"]+sys.path
+
+import fingenerators as fingen
+import calendarfuns as cal
+
+
+# ============================================================================
+def meanrevertingrates(numpaths, numperiods, initialrate, meanrate, reversion, volatility,
+                       cyclesPerAnnum=12, minrate=0., seed=None):
+    """Returns mean-reverting (Vasicek) annual interest rate paths
+
+    The rate follows dr = reversion * (meanrate - r) dt + volatility dW, sampled exactly
+    at the payment periods, so that the paths do not depend on the discretisation.
+    The rates are floored at minrate afterwards, the floor does not feed back into the paths.
+
+    :param numpaths: Number of paths.
+    :param numperiods: Number of periods in each path, the first period has initialrate.
+    :param initialrate: Annual rate in the first period.
+    :param meanrate: Long term annual rate that the paths revert to.
+    :param reversion: Speed of mean reversion, per year.
+    :param volatility: Annual volatility of the rate.
+    :param cyclesPerAnnum: Number of payment cycles in a year.
+    :param minrate: Lowest rate in the paths, None for no floor.
+    :param seed: Seed or numpy Generator, for repeatable paths.
+
+    :return:
+        rates: (path x period) array of annual rates
+    """
+    rng = np.random.default_rng(seed)
+    dt = 1 / cyclesPerAnnum
+    decay = np.exp(-reversion * dt)
+    if reversion > 0:
+        stddev = volatility * np.sqrt((1 - decay**2) / (2 * reversion))
+    else:
+        stddev = volatility * np.sqrt(dt)
+
+    rates = rng.standard_normal((numpaths, numperiods))
+    rates *= stddev
+    rates[:, 0] = initialrate - meanrate
+    for p in range(1, numperiods):
+        rates[:, p] += decay * rates[:, p - 1]
+    rates += meanrate
+    if minrate is not None:
+        np.maximum(rates, minrate, out=rates)
+    return rates
+
+
+# ============================================================================
+def _quantilelabels(quantiles):
+    """Row labels such as P5, P50, P95 for the quantiles
+    """
+    return [f'P{100 * q:g}' for q in quantiles]
+
+
+# ============================================================================
+def amortisation_montecarlo(principal, bondyears, reqpayment, addpayment=0, addpayrate=0,
+                            numpaths=10000, initialrate=0.1, meanrate=0.1, reversion=0.5, volatility=0.01,
+                            minrate=0., rates=None, cyclesPerAnnum=12, start_date=(date(2000,1,1)),
+                            recalcpayment=False, seed=None, horizonyears=None, maxyears=200,
+                            quantiles=(0.05, 0.5, 0.95)):
+    """
+    Amortise a loan under many simulated interest rate paths
+
+    All paths are amortised together with fingenerators.amortisation_batch, as one
+    (path x period) calculation, and only the payoff information of each path is kept.
+    Paths on which the loan is not paid off within maxyears, e.g. where the rate rises 
+    until the required payment no longer covers the interest, are reported as unpaid 
+    and left out of the distribution.
+
+    :param principal: Amount borrowed (positive)
+    :param bondyears: Number of years for the loan (positive)
+    :param reqpayment: minimum required payment to meet the term requirements (negative)
+    :param addpayment (optional): Additional payments, in the complex notation used by
+        amortisation_table, e.g. 0.02j. Default 0.
+    :param addpayrate (optional): Rate of increase in additional payment, calculated once per year.
+    :param numpaths (optional): Number of rate paths. Default 10000.
+    :param initialrate, meanrate, reversion, volatility, minrate (optional): rate model, see meanrevertingrates.
+    :param rates (optional): (path x period) annual rate paths to use instead of the rate model.
+    :param cyclesPerAnnum (optional): Number of payment cycles in a year. Default 12.
+    :param start_date (optional): Start date. Default 2000-01-01.
+    :param recalcpayment (optional): Recalculate the required payment from the balance whenever 
+        the rate changes, to pay off the loan over the remainder of bondyears. Additional 
+        payments then lower the later required payments rather than shorten the loan, so that
+        all the paths pay off after bondyears. Default False, the required payment stays fixed.
+    :param seed (optional): Seed or numpy Generator, for repeatable paths.
+    :param horizonyears (optional): Years of simulated rates, after which the last rate of
+        each path continues. Default twice bondyears.
+    :param maxyears (optional): Give up if the loan is not paid off within this many years.
+    :param quantiles (optional): Quantiles of the distributions. Default (0.05, 0.5, 0.95).
+
+    :return:
+        paths: Pandas dataframe with the payoff information of each path, see amortisation_batch,
+            with Num Payments -1, Payoff Date NaT and Total Interest NaN for the unpaid paths
+        distribution: Pandas dataframe with the mean and quantiles of the Num Payments,
+            Payoff Date and Total Interest over the paths that are paid off, and the number of
+            Unpaid paths. The total interest is negative, so that its low quantiles are the 
+            expensive paths. The statistics are NaN if no path is paid off.
+    """
+    if rates is None:
+        horizonyears = 2 * bondyears if horizonyears is None else horizonyears
+        rates = meanrevertingrates(numpaths, int(np.ceil(horizonyears * cyclesPerAnnum)), initialrate,
+                                   meanrate, reversion, volatility, cyclesPerAnnum=cyclesPerAnnum,
+                                   minrate=minrate, seed=seed)
+
+    _, paths = fingen.amortisation_batch(principal, None, bondyears, reqpayment, addpayment=addpayment,
+                                         addpayrate=addpayrate, cyclesPerAnnum=cyclesPerAnnum,
+                                         start_date=start_date, doschedule=False, maxyears=maxyears,
+                                         ratepaths=rates, recalcpayment=recalcpayment, giveup=True)
+
+    paid = paths['Num Payments'].to_numpy() >= 0
+    numpay = paths['Num Payments'].to_numpy()[paid]
+    totinterest = paths['Total Interest'].to_numpy()[paid]
+    quantiles = list(quantiles)
+    if numpay.shape[0] > 0:
+        paycounts = np.quantile(numpay, quantiles, method='inverted_cdf')
+        dates, _, _ = cal.periodcalendar(start_date, cyclesPerAnnum, max(int(np.max(numpay)), 1))
+        meandate = dates[0] + np.timedelta64(int(round(np.mean((paths['Payoff Date'].to_numpy()[paid] -
+                                                                dates[0]) / np.timedelta64(1, 'D')))), 'D')
+        payoffdates = [pd.Timestamp(meandate)] + [pd.Timestamp(dates[max(n - 1, 0)]) for n in paycounts]
+        numpays = np.concatenate([[numpay.mean()], paycounts])
+        totinterests = np.concatenate([[totinterest.mean()], np.quantile(totinterest, quantiles)])
+    else:
+        payoffdates = [pd.NaT] * (len(quantiles) + 1)
+        numpays = totinterests = np.full(len(quantiles) + 1, np.nan)
+
+    distribution = pd.DataFrame(OrderedDict([
+        ('Num Payments', numpays),
+        ('Payoff Date', payoffdates),
+        ('Total Interest', totinterests),
+        ('Unpaid', np.count_nonzero(~paid)),
+        ]), index=['Mean'] + _quantilelabels(quantiles))
+    return paths, distribution
+
+
+# ============================================================================
+def periodreturns(rng, numpaths, growthrate, volatility, cyclesPerAnnum=12, distribution='normal', dof=5):
+    """Returns one period's random market returns for numpaths paths
+
+    The returns have mean growthrate / cyclesPerAnnum and standard deviation 
+    volatility / sqrt(cyclesPerAnnum), so that the growth of a period is the begin 
+    balance times the return, as in fingenerators.investmentgrowth.
+
+    :param rng: numpy Generator.
+    :param numpaths: Number of paths.
+    :param growthrate: The mean annual growth rate.
+    :param volatility: The annual volatility of the growth.
+    :param cyclesPerAnnum: Number of investment payment cycles in a year.
+    :param distribution: 'normal', 'lognormal' (for one plus the return) or 'student-t'
+        (scaled to the given standard deviation, which requires dof > 2).
+    :param dof: Degrees of freedom of the student-t distribution.
+
+    :return:
+        returns: array of numpaths returns for the period
+    """
+    mean = growthrate / cyclesPerAnnum
+    stddev = volatility / np.sqrt(cyclesPerAnnum)
+    if distribution == 'normal':
+        return rng.normal(mean, stddev, numpaths)
+    if distribution == 'lognormal':
+        # one plus the return is lognormal, with the required mean and standard deviation
+        sigma2 = np.log1p((stddev / (1 + mean))**2)
+        return np.expm1(rng.normal(np.log1p(mean) - sigma2 / 2, np.sqrt(sigma2), numpaths))
+    if distribution == 'student-t':
+        if dof <= 2:
+            raise ValueError(f'The student-t distribution requires dof > 2, not {dof}')
+        return mean + stddev * np.sqrt((dof - 2) / dof) * rng.standard_t(dof, numpaths)
+    raise ValueError(f"Unknown distribution = {distribution}, use 'normal', 'lognormal' or 'student-t'")
+
+
+# ============================================================================
+def investment_montecarlo(initialvalue, growthrate, termyears, volatility, addpayment=0, addpaymentrate=0,
+                          costBalPcnt=0, numpaths=10000, distribution='normal', dof=5,
+                          start_date=(date(2000,1,1)), cyclesPerAnnum=12, seed=None,
+                          quantiles=(0.05, 0.5, 0.95)):
+    """
+    Grow an investment under many random market return paths, and return the percentile bands
+
+    All paths are stepped together, one period at a time, with the investmentgrowth
+    recurrence, the cost on balance and the yearly escalation of the additional payment.
+    The percentiles of the End Balance over the paths are taken after every period, and 
+    only the balances of the current period are kept, so that the memory used is that of
+    numpaths balances plus the bands, not that of the schedules of all the paths.
+
+    :param initialvalue: Initial value paid into the investment
+    :param growthrate: The mean annual growth rate
+    :param termyears: Number of years for the investment
+    :param volatility: The annual volatility of the growth, see periodreturns
+    :param addpayment: Additional investment amount per period
+    :param addpaymentrate: growth in the additional investment compounded annually 
+    :param costBalPcnt: managment cost as percentage on balance
+    :param numpaths: Number of paths. Default 10000.
+    :param distribution: Distribution of the returns, see periodreturns. Default 'normal'.
+    :param dof: Degrees of freedom of the student-t distribution. Default 5.
+    :param start_date: Start date for the investment.
+    :param cyclesPerAnnum: Number of investment payment cycles in a year, see calendarfuns.periodcalendar.
+    :param seed: Seed or numpy Generator, for repeatable paths.
+    :param quantiles: Quantiles of the End Balance. Default (0.05, 0.5, 0.95).
+
+    :return:
+        bands: Pandas dataframe with the Period, Month, and the Mean and the quantiles 
+            (as P5, P50, P95) of the End Balance after each period
+    """
+    rng = np.random.default_rng(seed)
+    returns = (periodreturns(rng, numpaths, growthrate, volatility, cyclesPerAnnum, distribution, dof)
+               for p in range(max(int(np.ceil(termyears * cyclesPerAnnum)) - 1, 0)))
+    return _investmentbands(initialvalue, returns, termyears, addpayment, addpaymentrate, costBalPcnt, 
+                            numpaths, start_date, cyclesPerAnnum, quantiles)
+
+
+# ============================================================================
+def _investmentbands(initialvalue, returns, termyears, addpayment, addpaymentrate, costBalPcnt, 
+                     numpaths, start_date, cyclesPerAnnum, quantiles):
+    """Steps all paths with the investmentgrowth recurrence and returns the End Balance bands
+
+    returns yields the numpaths returns of each period in turn, see investment_montecarlo.
+    """
+    quantiles = list(quantiles)
+
+    # investmentgrowth runs while period < termyears * cyclesPerAnnum
+    numperiods = max(int(np.ceil(termyears * cyclesPerAnnum)) - 1, 0)
+    dates, _, newyear = cal.periodcalendar(start_date, cyclesPerAnnum, numperiods)
+
+    balance = np.full(numpaths, float(initialvalue))
+    growth, costBal = np.empty((2, numpaths))
+    means = np.empty(numperiods)
+    bands = np.empty((numperiods, len(quantiles)))
+    for p, periodreturn in zip(range(numperiods), returns):
+        # only increase the additional payment once per year
+        if newyear[p]:
+            addpayment *= 1 + addpaymentrate
+        np.multiply(balance, periodreturn, out=growth)
+        np.multiply(balance, costBalPcnt / cyclesPerAnnum, out=costBal)
+        balance += growth
+        balance += addpayment
+        balance -= costBal
+        means[p] = balance.mean()
+        bands[p] = np.quantile(balance, quantiles)
+
+    return pd.DataFrame(OrderedDict([('Period', np.arange(1, numperiods + 1)),
+                                     ('Month', dates),
+                                     ('Mean', means)] +
+                                    list(zip(_quantilelabels(quantiles), bands.T))))
+
+
+# ============================================================================
+def buildreturnstore(source, storefile, sheet_name=0, datecol=0, columns=None, kind='returns', 
+                     percent=False, cyclesPerAnnum=12, rebuild=False):
+    """Converts historical return series from a CSV file or spreadsheet into a .npy return store
+
+    The store is written once, and only rebuilt if the source is newer than the store, if
+    the store was built from another source or with other options, or if rebuild is set, 
+    so that later runs skip parsing the spreadsheets. The returns are 
+    saved as one (period x series) float array in storefile, which loadreturnstore opens
+    memory-mapped, and the dates and series names in a json file next to it.
+
+    :param source: CSV (.csv) or Excel (.xls, .xlsx) file with a date column and one column 
+        per series. Reading .xls files requires the xlrd package.
+    :param storefile: Name of the .npy file of the store.
+    :param sheet_name: Excel sheet, or list of sheets whose series are joined on the dates.
+    :param datecol: Name or position of the date column.
+    :param columns: Names of the series to keep, None for all numeric columns.
+    :param kind: 'returns' if the series are returns per period, 'prices' if they are index 
+        levels or prices, from which the returns are calculated.
+    :param percent: True if the returns are given in percent.
+    :param cyclesPerAnnum: Number of periods per year of the series, 12 for monthly series.
+    :param rebuild: Rebuild the store even if it is newer than the source.
+
+    :return:
+        returns, dates, names: see loadreturnstore
+    """
+    metafile = os.path.splitext(storefile)[0] + '.json'
+    # the build options as they are read back from the json file
+    options = json.loads(json.dumps({'source': os.path.abspath(source), 'sheet_name': sheet_name, 
+                                     'datecol': datecol, 'columns': columns, 'kind': kind, 
+                                     'percent': percent, 'cyclesPerAnnum': cyclesPerAnnum}))
+    if (not rebuild and os.path.exists(storefile) and os.path.exists(metafile) and 
+        os.path.getmtime(storefile) >= os.path.getmtime(source)):
+        with open(metafile) as fin:
+            if json.load(fin).get('options') == options:
+                return loadreturnstore(storefile)
+
+    def readframe(sheet):
+        if os.path.splitext(source)[1].lower() == '.csv':
+            df = pd.read_csv(source)
+        else:
+            df = pd.read_excel(source, sheet_name=sheet)
+        datename = df.columns[datecol] if isinstance(datecol, int) else datecol
+        df = df.set_index(pd.to_datetime(df.pop(datename))).sort_index()
+        df = df[columns] if columns is not None else df.select_dtypes('number')
+        if isinstance(sheet, str) and isinstance(sheet_name, (list, tuple)):
+            df.columns = [f'{sheet}:{name}' for name in df.columns]
+        return df.astype(float)
+
+    sheets = sheet_name if isinstance(sheet_name, (list, tuple)) else [sheet_name]
+    df = pd.concat([readframe(sheet) for sheet in sheets], axis=1).dropna()
+    if kind == 'prices':
+        df = df.pct_change().iloc[1:]
+    elif kind != 'returns':
+        raise ValueError(f"Unknown kind = {kind}, use 'returns' or 'prices'")
+    if percent:
+        df = df / 100
+
+    np.save(storefile, np.ascontiguousarray(df.to_numpy()))
+    with open(metafile, 'w') as fout:
+        json.dump({'source': os.path.abspath(source), 'cyclesPerAnnum': cyclesPerAnnum,
+                   'options': options, 'names': [str(name) for name in df.columns],
+                   'dates': [d.date().isoformat() for d in df.index]}, fout, indent=1)
+    return loadreturnstore(storefile)
+
+
+# ============================================================================
+def loadreturnstore(storefile):
+    """Opens a return store written by buildreturnstore
+
+    The returns are memory-mapped read-only, so that the store is not read into memory
+    and processes that open the same store share its pages.
+
+    :param storefile: Name of the .npy file of the store.
+
+    :return:
+        returns: (period x series) memory-mapped array of the returns per period
+        dates: numpy datetime64[D] array of the period dates
+        meta: dictionary with the series 'names', the 'cyclesPerAnnum', the 'source' file and
+            the build 'options'
+    """
+    with open(os.path.splitext(storefile)[0] + '.json') as fin:
+        meta = json.load(fin)
+    dates = np.array(meta.pop('dates'), dtype='datetime64[D]')
+    return np.load(storefile, mmap_mode='r'), dates, meta
+
+
+# ============================================================================
+def blockbootstrap(returns, numpaths, numperiods, blocklength=12, weights=None, seed=None):
+    """Yields resampled returns one period at a time, for numpaths paths
+
+    Each path is built from blocks of blocklength consecutive historical periods, starting at
+    random periods, so that the serial dependence within a block is kept. Blocks wrap around
+    from the last to the first historical period. All series are sampled in the same periods,
+    and combined into portfolio returns with weights.
+
+    :param returns: (period x series) historical returns, e.g. from loadreturnstore.
+    :param numpaths: Number of paths.
+    :param numperiods: Number of periods to yield.
+    :param blocklength: Number of consecutive periods in a block.
+    :param weights: Weight of each series in the portfolio, None for the first series only.
+    :param seed: Seed or numpy Generator, for repeatable paths.
+
+    :return:
+        generator of arrays of numpaths returns, one array per period
+    """
+    rng = np.random.default_rng(seed)
+    returns = np.asarray(returns)
+    if returns.ndim == 1:
+        returns = returns[:, np.newaxis]
+    if weights is None:
+        series = returns[:, 0]
+    else:
+        series = returns @ np.asarray(weights, dtype=float)
+    numhistory = series.shape[0]
+    if numhistory == 0:
+        raise ValueError('No historical returns to sample from')
+
+    for p in range(numperiods):
+        if p % blocklength == 0:
+            starts = rng.integers(0, numhistory, numpaths)
+        yield series[(starts + p % blocklength) % numhistory]
+
+
+# ============================================================================
+def investment_bootstrap(initialvalue, termyears, returns, addpayment=0, addpaymentrate=0, costBalPcnt=0,
+                         numpaths=10000, blocklength=12, weights=None, start_date=(date(2000,1,1)),
+                         cyclesPerAnnum=12, seed=None, quantiles=(0.05, 0.5, 0.95)):
+    """
+    Grow an investment under block-bootstrapped historical returns, and return the percentile bands
+
+    The resampled returns of blockbootstrap are fed directly into the investmentgrowth 
+    recurrence of investment_montecarlo, so that sequence-of-returns risk is replayed 
+    from history rather than drawn from a distribution.
+
+    :param initialvalue: Initial value paid into the investment
+    :param termyears: Number of years for the investment
+    :param returns: Name of a store written by buildreturnstore, or (period x series) 
+        historical returns per period of cyclesPerAnnum
+    :param addpayment: Additional investment amount per period
+    :param addpaymentrate: growth in the additional investment compounded annually 
+    :param costBalPcnt: managment cost as percentage on balance
+    :param numpaths: Number of paths. Default 10000.
+    :param blocklength: Number of consecutive historical periods in a block. Default 12.
+    :param weights: Weight of each series in the portfolio, None for the first series only.
+    :param start_date: Start date for the investment.
+    :param cyclesPerAnnum: Number of investment payment cycles in a year, which must be 
+        that of the store.
+    :param seed: Seed or numpy Generator, for repeatable paths.
+    :param quantiles: Quantiles of the End Balance. Default (0.05, 0.5, 0.95).
+
+    :return:
+        bands: Pandas dataframe with the Period, Month, and the Mean and the quantiles 
+            of the End Balance after each period, see investment_montecarlo
+    """
+    if isinstance(returns, str):
+        returns, _, meta = loadreturnstore(returns)
+        if meta['cyclesPerAnnum'] != cyclesPerAnnum:
+            raise ValueError(f"The store has {meta['cyclesPerAnnum']} periods per year, not {cyclesPerAnnum}")
+    numperiods = max(int(np.ceil(termyears * cyclesPerAnnum)) - 1, 0)
+    returns = blockbootstrap(returns, numpaths, numperiods, blocklength, weights, seed)
+    return _investmentbands(initialvalue, returns, termyears, addpayment, addpaymentrate, costBalPcnt, 
+                            numpaths, start_date, cyclesPerAnnum, quantiles)
+
+
+# ============================================================================
+def marketreturns(numpaths, numperiods, growthrate, volatility, cyclesPerAnnum=12, distribution='normal',
+                  dof=5, seed=None):
+    """Returns a (path x period) array of random market returns, see periodreturns
+    """
+    rng = np.random.default_rng(seed)
+    returns = np.empty((numpaths, numperiods))
+    for p in range(numperiods):
+        returns[:, p] = periodreturns(rng, numpaths, growthrate, volatility, cyclesPerAnnum, distribution, dof)
+    return returns
+
+
+# ============================================================================
+def _drawdown(initialvalue, withdrawal, returns, payrate, costBalPcnt, newyear, cyclesPerAnnum):
+    """Steps all paths of a drawdown, and returns the depletion period and end balance of each path
+
+    Paths that run out are held at a zero balance, with no further growth, costs or withdrawals.
+    """
+    numpaths, numperiods = returns.shape
+    balance = np.full(numpaths, float(initialvalue))
+    depleted = np.zeros(numpaths, dtype=np.int64)
+    add = - abs(withdrawal)
+    for p in range(numperiods):
+        # only increase the withdrawal once per year
+        if newyear[p]:
+            add *= payrate
+        balance += balance * returns[:, p] + add - balance * costBalPcnt / cyclesPerAnnum
+        # record the period in which each path runs out, and hold it at zero
+        out = (balance <= 0) & (depleted == 0)
+        depleted[out] = p + 1
+        np.maximum(balance, 0, out=balance)
+        balance[depleted > 0] = 0
+    return depleted, balance
+
+
+# ============================================================================
+def drawdown_simulation(initialvalue, withdrawal, returns, addpaymentrate=0, costBalPcnt=0,
+                        start_date=(date(2000,1,1)), cyclesPerAnnum=12):
+    """
+    Draw down a retirement investment under many return paths at once
+
+    The recurrence is that of fingenerators.investmentgrowth, with the withdrawal as a 
+    negative additional payment that escalates once per year with addpaymentrate 
+    (typically inflation). A path is depleted in the period in which its balance drops 
+    to zero, after which it stays at zero.
+
+    :param initialvalue: Value of the investment at the start of retirement
+    :param withdrawal: Withdrawal in the first period (its sign is ignored)
+    :param returns: (path x period) array of market returns per period, e.g. from 
+        marketreturns, or from blockbootstrap stacked along the periods
+    :param addpaymentrate: yearly escalation of the withdrawal
+    :param costBalPcnt: managment cost as percentage on balance
+    :param start_date: Start date of the drawdown.
+    :param cyclesPerAnnum: Number of withdrawals in a year, see calendarfuns.periodcalendar.
+
+    :return:
+        paths: Pandas dataframe with the 'Depletion Period' (0 if the money lasted), 
+            'Depletion Date' (NaT if the money lasted) and 'End Balance' of each path
+        survival: fraction of the paths for which the money lasted
+    """
+    returns = np.asarray(returns, dtype=float)
+    dates, _, newyear = cal.periodcalendar(start_date, cyclesPerAnnum, returns.shape[1])
+    depleted, balance = _drawdown(initialvalue, withdrawal, returns, 1 + addpaymentrate, costBalPcnt,
+                                  newyear, cyclesPerAnnum)
+    depletiondate = np.where(depleted > 0, dates[np.maximum(depleted - 1, 0)], np.datetime64('NaT'))
+    paths = pd.DataFrame(OrderedDict([('Depletion Period', depleted),
+                                      ('Depletion Date', depletiondate),
+                                      ('End Balance', balance),
+                                     ]))
+    return paths, np.mean(depleted == 0)
+
+
+# ============================================================================
+def safewithdrawalrate(initialvalue, termyears, survival=0.95, returns=None, growthrate=0.08, volatility=0.15,
+                       distribution='normal', numpaths=10000, addpaymentrate=0, costBalPcnt=0,
+                       start_date=(date(2000,1,1)), cyclesPerAnnum=12, seed=None, tolerance=1e-5, 
+                       maxrate=1.):
+    """
+    Find the highest withdrawal rate for which the money lasts with the given probability
+
+    The withdrawal rate is the first year's withdrawals as a fraction of the initial value,
+    withdrawn in equal parts every period and escalated yearly with addpaymentrate. The 
+    same return paths are used for all rates, and the rate is found by bisection on the
+    survival fraction of drawdown_simulation.
+
+    :param initialvalue: Value of the investment at the start of retirement
+    :param termyears: Number of years that the money must last
+    :param survival: Required fraction of the paths for which the money lasts. Default 0.95.
+    :param returns: (path x period) array of market returns per period for at least the term,
+        or None to draw them with marketreturns.
+    :param growthrate, volatility, distribution: the return model, see periodreturns
+    :param numpaths: Number of paths drawn if returns is None. Default 10000.
+    :param addpaymentrate: yearly escalation of the withdrawals, typically inflation
+    :param costBalPcnt: managment cost as percentage on balance
+    :param start_date: Start date of the drawdown.
+    :param cyclesPerAnnum: Number of withdrawals in a year.
+    :param seed: Seed or numpy Generator, for repeatable paths.
+    :param tolerance: Accuracy of the withdrawal rate. Default 1e-5.
+    :param maxrate: Highest withdrawal rate considered. Default 1.
+
+    :return:
+        rate: the safe withdrawal rate
+        paths: the drawdown_simulation paths at the safe withdrawal rate
+    """
+    numperiods = int(np.ceil(termyears * cyclesPerAnnum))
+    if returns is None:
+        returns = marketreturns(numpaths, numperiods, growthrate, volatility, cyclesPerAnnum, 
+                                distribution, seed=seed)
+    returns = np.asarray(returns, dtype=float)
+    if returns.shape[1] < numperiods:
+        raise ValueError(f'The returns have {returns.shape[1]} periods, the term requires {numperiods}')
+    returns = returns[:, :numperiods]
+    _, _, newyear = cal.periodcalendar(start_date, cyclesPerAnnum, numperiods)
+
+    def survives(rate):
+        depleted, _ = _drawdown(initialvalue, rate * initialvalue / cyclesPerAnnum, returns, 
+                                1 + addpaymentrate, costBalPcnt, newyear, cyclesPerAnnum)
+        return np.mean(depleted == 0) >= survival
+
+    low, high = 0., maxrate
+    if survives(high):
+        low = high
+    while high - low > tolerance:
+        mid = (low + high) / 2
+        if survives(mid):
+            low = mid
+        else:
+            high = mid
+
+    paths, _ = drawdown_simulation(initialvalue, low * initialvalue / cyclesPerAnnum, returns, addpaymentrate,
+                                   costBalPcnt, start_date, cyclesPerAnnum)
+    return low, paths
@@ -0,0 +1,121 @@
+import numpy as np
+from collections import OrderedDict
+
+
+# ============================================================================
+def taxtable(thresholds, rates, rebates=(0,), rebateages=(0,)):
+    """Returns a progressive income tax bracket table with the cumulative tax at each threshold
+
+    :param thresholds: Lower limits of the brackets of annual taxable income, increasing and
+        starting at zero
+    :param rates: Marginal tax rate in each bracket
+    :param rebates: Annual rebates, each deducted from the tax of taxpayers of at least the
+        corresponding age in rebateages
+    :param rebateages: Ages at which the rebates start to apply, increasing
+
+    :return: Ordered Dictionary of 'Threshold', 'Rate', 'CumTax', 'RebateAge' and 'CumRebate'
+        numpy arrays, where CumTax is the tax on an income equal to the threshold, and
+        CumRebate the total rebate from that age on.
+    """
+    thresholds = np.ravel(np.asarray(thresholds, dtype=float))
+    rates = np.ravel(np.asarray(rates, dtype=float))
+    if thresholds.shape != rates.shape or thresholds[0] != 0 or np.any(np.diff(thresholds) <= 0):
+        raise ValueError('The thresholds must start at zero and increase, with one rate for each threshold')
+    rebates = np.ravel(np.asarray(rebates, dtype=float))
+    rebateages = np.ravel(np.asarray(rebateages, dtype=float))
+    if rebates.shape != rebateages.shape:
+        raise ValueError('There must be one rebate age for each rebate')
+
+    table = OrderedDict()
+    table['Threshold'] = thresholds
+    table['Rate'] = rates
+    table['CumTax'] = np.concatenate([[0.], np.cumsum(rates[:-1] * np.diff(thresholds))])
+    table['RebateAge'] = rebateages
+    table['CumRebate'] = np.cumsum(rebates)
+    return table
+
+
+# ============================================================================
+# South African individual tax for the 2020 tax year (1 March 2019 to 29 February 2020),
+# with the primary, secondary (65 and older) and tertiary (75 and older) rebates
+sarstax2020 = taxtable(thresholds=[0, 195850, 305850, 423300, 555600, 708310, 1500000],
+                       rates=[0.18, 0.26, 0.31, 0.36, 0.39, 0.41, 0.45],
+                       rebates=[14220, 7794, 2601], rebateages=[0, 65, 75])
+
+
+# ============================================================================
+def marginalrate(taxable, table):
+    """Returns the marginal tax rate on the annual taxable income, array or scalar
+    """
+    idx = np.searchsorted(table['Threshold'], np.maximum(taxable, 0), side='right') - 1
+    return table['Rate'][idx]
+
+
+# ============================================================================
+def incometax(taxable, table, age=None):
+    """Returns the (positive) income tax on annual taxable incomes
+
+    The bracket of each income is found by one searchsorted over the thresholds, after
+    which the tax is the cumulative tax up to the bracket plus the marginal rate on the
+    rest. The rebates are deducted, but the tax is never negative.
+
+    :param taxable: Annual taxable income, array or scalar
+    :param table: Tax bracket table, see taxtable
+    :param age: Age of the taxpayer for the rebates, array or scalar, None for the first rebate only
+
+    :return: tax, with the broadcast shape of taxable and age
+    """
+    taxable = np.maximum(np.asarray(taxable, dtype=float), 0)
+    idx = np.searchsorted(table['Threshold'], taxable, side='right') - 1
+    tax = table['CumTax'][idx] + table['Rate'][idx] * (taxable - table['Threshold'][idx])
+    if age is None:
+        rebate = table['CumRebate'][0]
+    else:
+        rebate = table['CumRebate'][np.maximum(np.searchsorted(table['RebateAge'], age, side='right') - 1, 0)]
+    return np.maximum(tax - rebate, 0)
+
+
+# ============================================================================
+def taxyears(dates, yearstartmonth=3):
+    """Returns the tax year of each date, for tax years starting on the first of yearstartmonth
+
+    The tax year is labelled by the calendar year in which it ends, as with the SARS tax years.
+    """
+    months = np.asarray(dates, dtype='datetime64[M]').astype(np.int64)
+    return (months - (yearstartmonth - 1)) // 12 + 1970 + (1 if yearstartmonth > 1 else 0)
+
+
+# ============================================================================
+def monthlytax(income, dates, table, otherincome=0, age=None, yearstartmonth=3):
+    """Returns the (negative) monthly tax on monthly income, allocated from the annual tax
+
+    The monthly income is added up per tax year and taxed at the margin on top of the
+    other (annual) income of the taxpayer, i.e. as the tax on the total income less the tax
+    on the other income alone. The tax of each year is allocated back to the months in
+    proportion to their income, so that a loss in one month reduces the tax on the income
+    of the other months in the same year, and an annual loss reduces the tax on the other 
+    income. The first and last tax years can be partial.
+
+    :param income: Monthly taxable income, (... x month) array for many scenarios
+    :param dates: Date of each month, increasing, shared by all scenarios
+    :param table: Tax bracket table, see taxtable
+    :param otherincome: Other annual taxable income, broadcast against income[..., 0]
+    :param age: Age of the taxpayer for the rebates, broadcast against income[..., 0]
+    :param yearstartmonth: First month of the tax year, default 3 (March)
+
+    :return: monthly tax, negative as the Tax column of rentalfuns.rentalProperty
+    """
+    income = np.asarray(income, dtype=float)
+    if income.shape[-1] == 0:
+        return np.zeros(income.shape)
+    years = taxyears(dates, yearstartmonth)
+    starts = np.flatnonzero(np.diff(years, prepend=years[0] - 1))
+    yearidx = np.cumsum(np.diff(years, prepend=years[0]) != 0)
+
+    annual = np.add.reduceat(income, starts, axis=-1)
+    other = np.asarray(otherincome, dtype=float)[..., np.newaxis]
+    age = None if age is None else np.asarray(age)[..., np.newaxis]
+    annualtax = incometax(other + annual, table, age) - incometax(other, table, age)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = np.where(annual[..., yearidx] != 0, income / annual[..., yearidx], 0)
+    return - annualtax[..., yearidx] * share
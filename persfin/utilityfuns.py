@@ -14,6 +14,7 @@ from IPython.display import Latex
 sys.path = ["./"]+sys.path
 
 import fingenerators as fingen
+import memofuns as memo
 
 
 # ============================================================================
@@ -72,30 +73,76 @@ def df_annual_amort_interest(schedule, stats):
 
 
 # ============================================================================
-def calc_scenarios(scenarios,cyclesPerAnnum=12,paymentSign=1):
+def _scenarioworker(chunk):
+    """Calculates the bond schedules and statistics of a chunk of scenarios in a worker process
+
+    The results are returned as numpy arrays and lists, which are cheaper to transfer 
+    between processes than pickled dataframes.
+    """
+    results = []
+    for princ, intr, years, reqPayment, addPayment, cyclesPerAnnum in chunk:
+        schedule, stats = fingen.amortisation_table(princ, intr, years, reqPayment, addPayment,
+                                                    cyclesPerAnnum=cyclesPerAnnum)
+        columns = None if schedule is None else OrderedDict((colname, schedule[colname].to_numpy()) 
+                                                            for colname in schedule.columns)
+        results.append((columns, list(stats.index), list(stats.values)))
+    return results
+
+
+# ============================================================================
+def calc_scenarios(scenarios,cyclesPerAnnum=12,paymentSign=1,processes=1,chunksize=None):
     """Given a scenario dictionary calculate bond schedules and statistics
+
+    The scenarios are independent and can be spread over a pool of worker processes, in 
+    chunks of scenarios. The results are in the order of the scenarios, whatever the 
+    number of processes. The scenarios dictionary is not changed: a missing reqPayment is
+    calculated for the term of the bond, but not written back.
+
+    :param scenarios: Dictionary of scenarios, each a dictionary of 'princ', 'intr', 'years',
+        'addPayment' and optionally 'reqPayment', keyed on the scenario name.
+    :param cyclesPerAnnum: Number of payment cycles in a year.
+    :param paymentSign: Sign of the calculated reqPayment.
+    :param processes: Number of worker processes, None for one per CPU. With 1 the 
+        scenarios are calculated in this process. Default 1.
+    :param chunksize: Number of scenarios sent to a worker at a time, None for about
+        four chunks per process.
+
+    :return:
+        schedules: Dictionary of the amortisation_table schedules, keyed on the scenario name
+        stats: Dictionary of the amortisation_table statistics, keyed on the scenario name
     """
-    schedules = {}
-    stats = {}
-    
+    tasks = []
     for scenario in scenarios.keys():
-        if 'reqPayment' not in scenarios[scenario].keys():
-            scenarios[scenario]['reqPayment'] = \
-                paymentSign * round(np.pmt(scenarios[scenario]['intr'] / cyclesPerAnnum, 
-                              scenarios[scenario]['years'] * cyclesPerAnnum, 
-                              scenarios[scenario]['princ']), 2);
-       
-        schedules[scenario], stats[scenario] = fingen.amortisation_table(
-                        scenarios[scenario]['princ'], 
-                        scenarios[scenario]['intr'], 
-                        scenarios[scenario]['years'], 
-                        scenarios[scenario]['reqPayment'], 
-                        scenarios[scenario]['addPayment'],
-                        cyclesPerAnnum=12
-                    );
-    return schedules,stats
+        params = scenarios[scenario]
+        reqPayment = params.get('reqPayment')
+        if reqPayment is None:
+            reqPayment = paymentSign * float(fingen.annuitypayment(params['princ'], params['intr'] / cyclesPerAnnum,
+                                                                   params['years'] * cyclesPerAnnum, decimals=2))
+        tasks.append((params['princ'], params['intr'], params['years'], reqPayment, params['addPayment'], 
+                      cyclesPerAnnum))
 
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, len(tasks)))
+    if chunksize is None:
+        chunksize = max(1, -(-len(tasks) // (4 * processes)))
+    chunks = [tasks[i:i + chunksize] for i in range(0, len(tasks), chunksize)]
 
+    if processes == 1 or len(chunks) == 1:
+        results = [_scenarioworker(chunk) for chunk in chunks]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            # map returns the chunks in the order of submission
+            results = list(pool.map(_scenarioworker, chunks))
+
+    schedules = {}
+    stats = {}
+    for scenario, (columns, index, values) in zip(scenarios.keys(), 
+                                                   (result for chunk in results for result in chunk)):
+        schedules[scenario] = None if columns is None else pd.DataFrame(columns)
+        stats[scenario] = pd.Series(values, index=index)
+    return schedules,stats
 
 
 
@@ -104,12 +151,16 @@ def calc_scenarios(scenarios,cyclesPerAnnum=12,paymentSign=1):
 def bondtaxsavingsanalysis(principal,interest_rate,bondyears,taxrate,rentpmonth,
                            increasepyear,cyclesPerAnnum=12,addpayment=0,addpayrate=0):
     """Calculate a monthly schedule and summary of tax benefit on bond loan
+
+    The taxrate can be an array of tax rates, evaluated together over one bond schedule 
+    and one rent schedule. The schedules of the tax rates are then stacked in one 
+    dataframe, one tax rate after the other, and the summary has a row per tax rate.
     """
     
-    reqpayment = round(np.pmt(interest_rate/cyclesPerAnnum, bondyears*cyclesPerAnnum, principal), 2)
+    reqpayment = float(fingen.annuitypayment(principal, interest_rate/cyclesPerAnnum, bondyears*cyclesPerAnnum, decimals=2))
 
     # calculate the mortgage 
-    df, stats = fingen.amortisation_table(
+    df, stats = memo.amortisation_table(
         principal=principal, 
         interest_rate=interest_rate, 
         bondyears=bondyears, 
@@ -120,57 +171,62 @@ def bondtaxsavingsanalysis(principal,interest_rate,bondyears,taxrate,rentpmonth,
         addpayrate=addpayrate)
 
     numcycles = stats['Num Payments']
-    rischedule = fingen.annIncreaseTable(value=rentpmonth, increasepyear=increasepyear, numcycles=numcycles)
-    # Now merge the bond table with the rent income table
-    dfc = df.copy().drop(["ReqPayment","AddPayment","Begin Balance"],axis=1)
-    dfc = dfc.merge(rischedule.drop(["Month"],axis=1), on='Period')
-    
-    # number of payments
-    dfc['NumPay'] = stats['Num Payments']
-    
-    # save tax for later
-    dfc['TaxRate'] = taxrate
-    
-    # tax and net income if **NO** bond present
-    dfc['TaxNoInter'] = - taxrate * (dfc['Rent'])
-    # can't get tax back
-    dfc['TaxNoInter'][dfc['TaxNoInter'] > 0] = 0
-    dfc['IncomeNoInter'] = dfc['Rent'] + dfc['TaxNoInter']
-
-    # tax and net income if bond present
-    dfc['TaxWithInter'] = - taxrate * (dfc['Rent'] + dfc['Interest'])
-    # can't get tax back
-    dfc['TaxWithInter'][dfc['TaxWithInter'] > 0] = 0
-    dfc['IncomeWithInter'] = dfc['Rent'] + dfc['TaxWithInter']
+    _, rent = fingen.escalation_arrays(rentpmonth, increasepyear, numcycles)
+    interest = df['Interest'].to_numpy()
+
+    # only the taxes depend on the tax rate, as an axis before the periods
+    taxrates = np.ravel(np.asarray(taxrate, dtype=float))[:, np.newaxis]
+
+    # tax and net income if **NO** bond present; can't get tax back
+    taxnointer = np.multiply(-taxrates, rent)
+    np.minimum(taxnointer, 0, out=taxnointer)
+    incomenointer = rent + taxnointer
+
+    # tax and net income if bond present; can't get tax back
+    taxwithinter = np.multiply(-taxrates, rent + interest)
+    np.minimum(taxwithinter, 0, out=taxwithinter)
+    incomewithinter = rent + taxwithinter
 
     # net benefit
-    dfc['BondBenefit'] = dfc['IncomeWithInter'] - dfc['IncomeNoInter']
+    bondbenefit = incomewithinter - incomenointer
+
+    # the bond and rent columns repeated for each tax rate
+    numrates = taxrates.shape[0]
+    columns = OrderedDict((colname, np.tile(df[colname].to_numpy(), numrates)) 
+                          for colname in df.columns if colname not in ["ReqPayment","AddPayment","Begin Balance"])
+    columns['Rent'] = np.tile(rent, numrates)
+    # number of payments
+    columns['NumPay'] = np.full(numrates * numcycles, numcycles)
+    # save tax for later
+    columns['TaxRate'] = np.repeat(taxrates[:, 0], numcycles)
+    columns['TaxNoInter'] = taxnointer.ravel()
+    columns['IncomeNoInter'] = incomenointer.ravel()
+    columns['TaxWithInter'] = taxwithinter.ravel()
+    columns['IncomeWithInter'] = incomewithinter.ravel()
+    columns['BondBenefit'] = bondbenefit.ravel()
+    dfc = pd.DataFrame(columns)
 
     #Create a summary statistics table
-    nistats = pd.Series([stats['Principal'],stats['Interest Rate'],
-                         stats['ReqPayment'],stats['AddPayment'],dfc["Period"].count(),
-                         rentpmonth,  increasepyear,
-                         taxrate,
-                         dfc["Rent"].sum(),
-                         dfc["TaxNoInter"].sum(),
-                         dfc["IncomeNoInter"].sum(),
-                         dfc["TaxWithInter"].sum(),
-                         dfc["IncomeWithInter"].sum(),
-                         dfc["BondBenefit"].sum(),
-                         100 * dfc["BondBenefit"].sum()/dfc["Rent"].sum(),
-                        ],
-                       index=["Bond","Interest Rate",
-                              "ReqPayment","AddPayment","Num Payments",
-                              "InitRent",  "RentIncrease",
-                              "TaxRate",
-                              "Total Rent",
-                              "TaxNoInter",
-                              "IncomeNoInter",
-                              "TaxWithInter",
-                              "IncomeWithInter",
-                              "BondBenefit",
-                              "Benefit/Rent %",
-                             ])
+    rentsum = rent.sum()
+    bondbenefitsum = bondbenefit.sum(axis=-1)
+    nistats = pd.DataFrame(OrderedDict([("Bond", stats['Principal']),
+                                        ("Interest Rate", stats['Interest Rate']),
+                                        ("ReqPayment", stats['ReqPayment']),
+                                        ("AddPayment", stats['AddPayment']),
+                                        ("Num Payments", numcycles),
+                                        ("InitRent", rentpmonth),
+                                        ("RentIncrease", increasepyear),
+                                        ("TaxRate", taxrates[:, 0]),
+                                        ("Total Rent", rentsum),
+                                        ("TaxNoInter", taxnointer.sum(axis=-1)),
+                                        ("IncomeNoInter", incomenointer.sum(axis=-1)),
+                                        ("TaxWithInter", taxwithinter.sum(axis=-1)),
+                                        ("IncomeWithInter", incomewithinter.sum(axis=-1)),
+                                        ("BondBenefit", bondbenefitsum),
+                                        ("Benefit/Rent %", 100 * bondbenefitsum / rentsum),
+                                       ]))
+    if np.ndim(taxrate) == 0:
+        nistats = nistats.iloc[0].rename(None)
 
     if False:
         figsize(12,8)